@@ -0,0 +1,103 @@
+# File: asf_smart_meter_exploration/analysis/anomaly_benchmark.py
+"""
+Script to benchmark the throughput of streaming anomaly detection in household-days
+per second. Uses synthetic readings and centroids by default so that it can be run
+without the processed data; pass --variant to use saved clusters and the processed data.
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration.pipeline.anomaly_detection import AnomalyDetector
+from asf_smart_meter_exploration.pipeline.data_aggregation import half_hours
+
+
+def synthetic_chunks(n_households, n_days, chunksize=4800, seed=0):
+    """Generate random half-hourly readings in the wide format of
+    `get_meter_data_chunks`.
+
+    Args:
+        n_households (int): Number of households.
+        n_days (int): Number of days.
+        chunksize (int, optional): Timestamps per chunk. Defaults to 4800.
+        seed (int, optional): Random seed. Defaults to 0.
+
+    Returns:
+        list: Chunks of readings.
+    """
+    rng = np.random.default_rng(seed)
+    tstps = pd.date_range("2013-01-01", periods=n_days * 48, freq="30min")
+    households = [f"MAC{i:06d}" for i in range(n_households)]
+
+    chunks = []
+    for start in range(0, len(tstps), chunksize):
+        chunk_tstps = tstps[start : start + chunksize]
+        chunk = pd.DataFrame(
+            rng.gamma(2, 0.15, size=(len(chunk_tstps), n_households)),
+            columns=households,
+        )
+        chunk.insert(0, "tstp", chunk_tstps)
+        chunk["time"] = chunk["tstp"].dt.time
+        chunks.append(chunk)
+
+    return chunks
+
+
+def run_benchmark(n_households=5000, n_days=100, k=4, variant=None):
+    """Time anomaly detection over a stream of readings.
+
+    Args:
+        n_households (int, optional): Number of synthetic households. Defaults to 5000.
+        n_days (int, optional): Number of synthetic days. Defaults to 100.
+        k (int, optional): Number of synthetic clusters. Defaults to 4.
+        variant (str, optional): If given, use this variant's saved clusters and the
+            processed meter data instead of synthetic data. Defaults to None.
+
+    Returns:
+        float: Household-days scored per second.
+    """
+    if variant is None:
+        chunks = synthetic_chunks(n_households, n_days)
+        rng = np.random.default_rng(1)
+        detector = AnomalyDetector(
+            chunks[0].columns[1:-1],
+            rng.integers(0, k, n_households),
+            rng.dirichlet(np.ones(len(half_hours)), size=k),
+            {
+                "aggregation": "get_average_usage",
+                "aggregation_kwargs": {"normalised": True},
+            },
+        )
+    else:
+        from asf_smart_meter_exploration.getters.get_processed_data import (
+            get_meter_data_chunks,
+        )
+
+        chunks = get_meter_data_chunks()
+        detector = AnomalyDetector.from_variant(variant)
+
+    start = time.perf_counter()
+    n_anomalies = sum(len(anomalies) for anomalies in detector.process(chunks))
+    elapsed = time.perf_counter() - start
+
+    household_days = int(detector.days_seen.sum())
+    print(
+        f"Scored {household_days} household-days in {elapsed:.1f} s "
+        f"({household_days / elapsed:,.0f} household-days/s), "
+        f"{n_anomalies} anomalies."
+    )
+
+    return household_days / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--households", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=100)
+    parser.add_argument("--variant", help="Use saved clusters and processed data.")
+    args = parser.parse_args()
+
+    run_benchmark(args.households, args.days, variant=args.variant)
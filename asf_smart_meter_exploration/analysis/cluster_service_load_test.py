@@ -0,0 +1,125 @@
+# File: asf_smart_meter_exploration/analysis/cluster_service_load_test.py
+"""
+Script to load test a running cluster assignment service (`smartmeter serve`).
+Sends requests with synthetic readings from several concurrent clients and
+reports latency percentiles and throughput.
+"""
+
+import argparse
+import json
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration import base_config
+
+cluster_service_host = base_config["cluster_service_host"]
+cluster_service_port = base_config["cluster_service_port"]
+
+
+def make_request_body(variant, request_number, households_per_request, rng):
+    """Build a request with one synthetic day of readings for each household.
+
+    Args:
+        variant (str): Name of variant.
+        request_number (int): Used to give each request its own households and day.
+        households_per_request (int): Number of households in the request.
+        rng (np.random.Generator): Random number generator.
+
+    Returns:
+        bytes: JSON request body.
+    """
+    day = pd.Timestamp("2014-01-01") + pd.Timedelta(days=request_number % 365)
+    tstps = pd.date_range(day, periods=48, freq="30min").astype(str).tolist()
+
+    readings = [
+        {"LCLid": f"LOADTEST{request_number}_{i}", "tstp": tstp, "energy": energy}
+        for i in range(households_per_request)
+        for tstp, energy in zip(tstps, rng.gamma(2, 0.15, size=48).tolist())
+    ]
+
+    return json.dumps({"variant": variant, "readings": readings}).encode()
+
+
+def post(url, body):
+    """Send a request and return its latency in milliseconds."""
+    request = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/json"}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        response.read()
+
+    return (time.perf_counter() - start) * 1000
+
+
+def run_load_test(
+    variant="total_usage",
+    n_requests=2000,
+    concurrency=32,
+    households_per_request=1,
+    host=cluster_service_host,
+    port=cluster_service_port,
+):
+    """Send requests concurrently and report latency.
+
+    Args:
+        variant (str, optional): Name of variant. Defaults to "total_usage".
+        n_requests (int, optional): Number of requests. Defaults to 2000.
+        concurrency (int, optional): Number of concurrent clients. Defaults to 32.
+        households_per_request (int, optional): Households per request. Defaults to 1.
+        host (str, optional): Service host. Defaults to `cluster_service_host`
+            in base config.
+        port (int, optional): Service port. Defaults to `cluster_service_port`
+            in base config.
+
+    Returns:
+        dict: p50 and p99 latency (ms) and throughput (requests per second).
+    """
+    url = f"http://{host}:{port}/assign"
+    rng = np.random.default_rng(0)
+    bodies = [
+        make_request_body(variant, i, households_per_request, rng)
+        for i in range(n_requests)
+    ]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(lambda body: post(url, body), bodies)))
+    elapsed = time.perf_counter() - start
+
+    results = {
+        "p50_ms": np.percentile(latencies, 50),
+        "p99_ms": np.percentile(latencies, 99),
+        "requests_per_second": n_requests / elapsed,
+    }
+    print(
+        f"{n_requests} requests, {concurrency} clients: "
+        f"p50 {results['p50_ms']:.1f} ms, p99 {results['p99_ms']:.1f} ms, "
+        f"{results['requests_per_second']:.0f} requests/s"
+    )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--variant", default="total_usage")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--households-per-request", type=int, default=1)
+    parser.add_argument("--host", default=cluster_service_host)
+    parser.add_argument("--port", type=int, default=cluster_service_port)
+    args = parser.parse_args()
+
+    run_load_test(
+        args.variant,
+        args.requests,
+        args.concurrency,
+        args.households_per_request,
+        args.host,
+        args.port,
+    )
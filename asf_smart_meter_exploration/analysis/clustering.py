@@ -3,70 +3,106 @@
 Script to perform clustering on variants of the smart meter data.
 For each cluster, plots of the counts and the distribution of
 tariffs / Acorn groups in each cluster are produced and saved.
+Cluster assignments are recorded in the results store (see `pipeline/results_store.py`).
 """
 
 import os
 import warnings
 
 from asf_smart_meter_exploration import PROJECT_DIR, base_config
-from asf_smart_meter_exploration.utils.clustering_utils import run_clustering
-from asf_smart_meter_exploration.config.plot_variants import variants_dict
+from asf_smart_meter_exploration.utils.clustering_utils import fit_clustering
+from asf_smart_meter_exploration.config import plot_variants
 from asf_smart_meter_exploration.pipeline.data_aggregation import merge_household_data
-from asf_smart_meter_exploration.utils.plotting_utils import *
+from asf_smart_meter_exploration.pipeline.incremental_features import variant_recipe
+from asf_smart_meter_exploration.pipeline.results_store import (
+    ResultsStore,
+    new_run_id,
+)
+from asf_smart_meter_exploration.utils.plotting_utils import (
+    plot_acorn_cluster_distribution,
+    plot_cluster_counts,
+    plot_observations_and_clusters,
+    plot_tariff_cluster_distribution,
+)
 
 cluster_plot_folder_path = PROJECT_DIR / base_config["cluster_plot_folder_path"]
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 
-def cluster_and_plot(type):
+def cluster_and_plot(type, run_id=None):
     """Cluster and plot an entry in the variants dictionary.
 
     Args:
         type (str): Name of variant.
+        run_id (str, optional): Run to record the cluster assignments under.
+            Defaults to a new run.
 
     Raises:
         ValueError: if `type` is not one of the dictionary keys.
     """
-    if type not in variants_dict.keys():
+    if type not in plot_variants.variant_specs.keys():
         raise ValueError(type + " is not implemented.")
     else:
-        type_dict = variants_dict[type]
+        type_dict = plot_variants.variants_dict[type]
 
         df = type_dict["df"]
         k = type_dict["k"]
 
-        clusters = run_clustering(df, k)
-
-        if not os.path.isdir(cluster_plot_folder_path):
-            os.makedirs(cluster_plot_folder_path)
-
-        # Create and save cluster plots using the parameters from the dict
-        # Use variant name as part of filename
-        plot_observations_and_clusters(
+        kmeans = fit_clustering(df, k)
+        clusters = ResultsStore().record_clustering(
+            run_id or new_run_id(),
+            type,
             df,
-            clusters,
-            filename_infix=type,
-            normalised=type_dict["normalised"],
-            ylabel=type_dict["ylabel"],
-            ymin=type_dict["ymin"],
-            ymax=type_dict["ymax"],
+            kmeans.cluster_centers_,
+            variant_recipe(plot_variants.variant_specs[type]),
+            inertia=kmeans.inertia_,
         )
 
-        plot_cluster_counts(clusters, filename_infix=type)
+        plot_variant_clusters(type, df, clusters)
+
+
+def plot_variant_clusters(type, df, clusters):
+    """Produce and save all cluster plots for a variant.
+
+    Args:
+        type (str): Name of variant.
+        df (pd.DataFrame): Variant data, with households as rows.
+        clusters (list): Cluster assignments for each row of `df`.
+    """
+    type_dict = plot_variants.variant_specs[type]
+
+    if not os.path.isdir(cluster_plot_folder_path):
+        os.makedirs(cluster_plot_folder_path)
+
+    # Create and save cluster plots using the parameters from the dict
+    # Use variant name as part of filename
+    plot_observations_and_clusters(
+        df,
+        clusters,
+        filename_infix=type,
+        normalised=type_dict["normalised"],
+        ylabel=type_dict["ylabel"],
+        ymin=type_dict["ymin"],
+        ymax=type_dict["ymax"],
+    )
+
+    plot_cluster_counts(clusters, filename_infix=type)
 
-        # Attach cluster column and merge household data for plotting distributions
-        df["cluster"] = clusters
-        merged_df = merge_household_data(df)
+    # Attach cluster column and merge household data for plotting distributions
+    df = df.copy()
+    df["cluster"] = clusters
+    merged_df = merge_household_data(df)
 
-        plot_tariff_cluster_distribution(merged_df, filename_infix=type)
-        plot_acorn_cluster_distribution(merged_df, filename_infix=type)
+    plot_tariff_cluster_distribution(merged_df, filename_infix=type)
+    plot_acorn_cluster_distribution(merged_df, filename_infix=type)
 
 
 def cluster_and_plot_all_variants():
-    """Cluster and plot all variants in variants_dict."""
-    for type in variants_dict.keys():
-        cluster_and_plot(type)
+    """Cluster and plot all variants in variants_dict, recording them as one run."""
+    run_id = new_run_id()
+    for type in plot_variants.variant_specs.keys():
+        cluster_and_plot(type, run_id)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+# File: asf_smart_meter_exploration/analysis/daily_archetypes.py
+"""
+Script to plot archetype daily load shapes found by clustering household-days,
+then cluster households by their mix of archetypes. For each cluster of households,
+plots of the counts and the distribution of tariffs / Acorn groups are produced and
+saved.
+"""
+
+import os
+
+from asf_smart_meter_exploration import PROJECT_DIR, base_config
+from asf_smart_meter_exploration.getters.get_processed_data import (
+    get_daily_archetypes,
+    get_daily_archetype_histograms,
+)
+from asf_smart_meter_exploration.pipeline.data_aggregation import merge_household_data
+from asf_smart_meter_exploration.utils.clustering_utils import run_clustering
+from asf_smart_meter_exploration.utils.plotting_utils import (
+    plot_acorn_cluster_distribution,
+    plot_cluster_counts,
+    plot_daily_archetypes,
+    plot_tariff_cluster_distribution,
+)
+
+cluster_plot_folder_path = PROJECT_DIR / base_config["cluster_plot_folder_path"]
+household_archetype_mix_k = base_config["household_archetype_mix_k"]
+
+
+def cluster_and_plot_archetype_mix(k=household_archetype_mix_k):
+    """Plot daily archetypes, then cluster and plot households by archetype mix.
+
+    Args:
+        k (int, optional): Number of household clusters.
+            Defaults to `household_archetype_mix_k` in base config.
+    """
+    if not os.path.isdir(cluster_plot_folder_path):
+        os.makedirs(cluster_plot_folder_path)
+
+    plot_daily_archetypes(get_daily_archetypes(), filename_infix="daily")
+
+    histograms = get_daily_archetype_histograms()
+    clusters = run_clustering(histograms, k)
+
+    plot_cluster_counts(clusters, filename_infix="archetype_mix")
+
+    histograms["cluster"] = clusters
+    merged_df = merge_household_data(histograms)
+
+    plot_tariff_cluster_distribution(merged_df, filename_infix="archetype_mix")
+    plot_acorn_cluster_distribution(merged_df, filename_infix="archetype_mix")
+
+
+if __name__ == "__main__":
+    cluster_and_plot_archetype_mix()
@@ -7,7 +7,7 @@ to inform choice of k for each variant.
 import os
 
 from asf_smart_meter_exploration import PROJECT_DIR, base_config
-from asf_smart_meter_exploration.config.plot_variants import variants_dict
+from asf_smart_meter_exploration.config import plot_variants
 from asf_smart_meter_exploration.utils.clustering_utils import clustering_inertias
 from asf_smart_meter_exploration.utils.plotting_utils import plot_inertias
 
@@ -20,8 +20,8 @@ def produce_inertia_plots():
     if not os.path.isdir(inertia_plot_folder_path):
         os.makedirs(inertia_plot_folder_path)
 
-    for key in variants_dict.keys():
-        inertias = clustering_inertias(variants_dict[key]["df"])
+    for key in plot_variants.variant_specs.keys():
+        inertias = clustering_inertias(plot_variants.variants_dict[key]["df"])
         plot_inertias(inertias, filename=key)
 
 
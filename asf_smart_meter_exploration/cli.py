@@ -0,0 +1,229 @@
+# File: asf_smart_meter_exploration/cli.py
+"""
+Command line interface for running the pipeline headlessly, e.g.
+
+    smartmeter run cluster plot --variants total_usage normalised_usage
+    smartmeter run aggregate --shards 8
+    smartmeter serve --port 8050
+    smartmeter results household MAC000002 --variant total_usage
+    smartmeter refresh --variants normalised_usage
+
+Stages that the requested stages depend on are run first, and stages whose
+outputs are newer than their inputs are skipped. `serve` starts the cluster
+assignment service (see `pipeline/cluster_service.py`) and `results` queries
+clustering results recorded by previous runs (see `pipeline/results_store.py`).
+`refresh` updates clusters with newly arrived readings without re-clustering
+(see `pipeline/online_clustering.py`).
+"""
+
+import argparse
+
+from asf_smart_meter_exploration import PROJECT_DIR, base_config
+from asf_smart_meter_exploration.pipeline.results_store import (
+    ResultsStore,
+    new_run_id,
+)
+from asf_smart_meter_exploration.pipeline.stages import (
+    build_tasks,
+    stage_names,
+    stage_tasks,
+)
+from asf_smart_meter_exploration.utils.dag_utils import run_tasks, with_dependencies
+
+stage_state_file_path = PROJECT_DIR / base_config["stage_state_file_path"]
+stage_max_workers = base_config["stage_max_workers"]
+
+
+def run(
+    stages,
+    variants=None,
+    jobs=stage_max_workers,
+    force=False,
+    shards=None,
+    backend=None,
+):
+    """Run pipeline stages and any stages they depend on.
+
+    Args:
+        stages (list): Stage names (see `pipeline/stages.py`).
+        variants (list, optional): Names of variants. Defaults to all variants.
+        jobs (int, optional): Maximum number of stages to run at once.
+            Defaults to `stage_max_workers` in base config.
+        force (bool, optional): Whether to rerun stages even if their outputs are
+            up to date. Defaults to False.
+        shards (int, optional): Number of shards to split ingest across
+            (see `pipeline/sharding.py`). Defaults to None (no sharding).
+        backend (str, optional): Shard backend. Defaults to `shard_backend`
+            in base config.
+
+    Returns:
+        dict: Names of tasks that were "run" and "skipped".
+    """
+    tasks = build_tasks(variants, shards=shards, backend=backend, run_id=new_run_id())
+    requested = [name for stage in stages for name in stage_tasks(tasks, stage)]
+
+    return run_tasks(
+        with_dependencies(tasks, requested),
+        stage_state_file_path,
+        max_workers=jobs,
+        force=force,
+    )
+
+
+def query_results(args):
+    """Run a `smartmeter results` query (see `pipeline/results_store.py`).
+
+    Args:
+        args (argparse.Namespace): Parsed arguments of the query.
+
+    Returns:
+        pd.DataFrame: Query result.
+    """
+    store = ResultsStore()
+
+    if args.query == "runs":
+        return store.runs()
+    if args.query == "household":
+        return store.household_history(args.lclid, args.variant)
+    if args.query == "clusters":
+        return store.clusters(args.variant, args.run)
+    return store.label_transitions(
+        args.variant, args.run_from, args.run_to, align=not args.no_align
+    )
+
+
+def main(argv=None):
+    """Parse command line arguments and run the requested command."""
+    parser = argparse.ArgumentParser(prog="smartmeter", description=__doc__)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run pipeline stages.")
+    run_parser.add_argument("stages", nargs="+", choices=stage_names)
+    run_parser.add_argument(
+        "--variants", nargs="+", help="Variants to process (defaults to all)."
+    )
+    run_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=stage_max_workers,
+        help="Maximum number of stages to run at once.",
+    )
+    run_parser.add_argument(
+        "--force", action="store_true", help="Rerun stages even if up to date."
+    )
+    run_parser.add_argument(
+        "--shards",
+        type=int,
+        help="Run ingest split across this many shards of households.",
+    )
+    run_parser.add_argument(
+        "--backend",
+        help="Shard backend: local, serial or module.path:BackendClass.",
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve", help="Start the cluster assignment service."
+    )
+    serve_parser.add_argument(
+        "--variants", nargs="+", help="Variants to serve (defaults to all clustered)."
+    )
+    serve_parser.add_argument("--host", help="Host to bind to.")
+    serve_parser.add_argument("--port", type=int, help="Port to bind to.")
+    serve_parser.add_argument(
+        "--seed",
+        action="store_true",
+        help="Start from the running sums of the processed meter data.",
+    )
+
+    results_parser = subparsers.add_parser(
+        "results", help="Query recorded clustering results."
+    )
+    queries = results_parser.add_subparsers(dest="query", required=True)
+    queries.add_parser("runs", help="List recorded runs.")
+    household_parser = queries.add_parser(
+        "household", help="Show a household's cluster in every run."
+    )
+    household_parser.add_argument("lclid")
+    household_parser.add_argument("--variant")
+    clusters_parser = queries.add_parser(
+        "clusters", help="Show cluster sizes and centroids."
+    )
+    clusters_parser.add_argument("variant")
+    clusters_parser.add_argument("--run", help="Run ID (defaults to latest).")
+    transitions_parser = queries.add_parser(
+        "transitions", help="Count households moving between clusters across runs."
+    )
+    transitions_parser.add_argument("variant")
+    transitions_parser.add_argument("run_from")
+    transitions_parser.add_argument("run_to")
+    transitions_parser.add_argument(
+        "--no-align",
+        action="store_true",
+        help="Compare raw cluster numbers instead of matching clusters by centroid.",
+    )
+
+    refresh_parser = subparsers.add_parser(
+        "refresh", help="Update clusters with readings added since the last refresh."
+    )
+    refresh_parser.add_argument(
+        "--variants",
+        nargs="+",
+        help="Variants to refresh (defaults to all except usage profiles).",
+    )
+    refresh_parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Add all readings again rather than only new ones.",
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        summary = run(
+            args.stages,
+            args.variants,
+            jobs=args.jobs,
+            force=args.force,
+            shards=args.shards,
+            backend=args.backend,
+        )
+        print(
+            f"Ran {len(summary['run'])} stages, "
+            f"skipped {len(summary['skipped'])} up-to-date stages."
+        )
+    elif args.command == "results":
+        print(query_results(args).to_string())
+    elif args.command == "refresh":
+        from asf_smart_meter_exploration.config.plot_variants import variant_specs
+        from asf_smart_meter_exploration.pipeline.online_clustering import (
+            refresh_online_clusters,
+        )
+
+        variants = args.variants or [
+            variant for variant, spec in variant_specs.items() if "profile" not in spec
+        ]
+        # All variants refreshed together are recorded under one run
+        run_id = new_run_id()
+        for variant in variants:
+            summary = refresh_online_clusters(
+                variant, rebuild=args.rebuild, run_id=run_id
+            )
+            print(
+                f"{variant}: updated {summary['updated']} households"
+                + (" (all readings re-added)" if summary["rebuilt"] else "")
+                + f", drift {summary['drift']:.3f}"
+                + (", refitted." if summary["refit"] else ".")
+            )
+    elif args.command == "serve":
+        from asf_smart_meter_exploration.pipeline.cluster_service import serve
+
+        options = {"host": args.host, "port": args.port}
+        serve(
+            args.variants,
+            seed=args.seed,
+            **{name: value for name, value in options.items() if value is not None},
+        )
+
+
+if __name__ == "__main__":
+    main()
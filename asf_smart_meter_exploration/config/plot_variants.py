@@ -3,22 +3,26 @@
 Dictionary defining the variants to cluster and plot.
 """
 
-from asf_smart_meter_exploration.utils.plotting_utils import *
-from asf_smart_meter_exploration.pipeline.data_aggregation import *
-
-from asf_smart_meter_exploration.getters.get_processed_data import get_meter_data
-
-meter_data = get_meter_data()
+from asf_smart_meter_exploration.pipeline.data_aggregation import (
+    get_average_usage,
+    get_daytype_diff,
+    get_season_diff,
+    get_usage_profiles,
+)
 
 # Dictionary of variants to cluster and plot.
-# "df" is the smart meter dataframe, "k" is the number of clusters,
-# and see docs for `plot_observations_and_clusters` (in `utils/plotting_utils.py`)
-# for other parameters.
+# "aggregation" is the function (from `pipeline/data_aggregation.py`) that produces
+# the variant's dataframe from the smart meter data, called with "aggregation_kwargs".
+# Variants with a "profile" instead take that entry of `get_usage_profiles`, which
+# computes all the profiles in a single pass.
+# "k" is the number of clusters, and see docs for `plot_observations_and_clusters`
+# (in `utils/plotting_utils.py`) for other parameters.
 # Values of k here were chosen after analysing plots produced in
 # `analysis/inertia_plots.py`.
-variants_dict = {
+variant_specs = {
     "total_usage": {
-        "df": get_average_usage(meter_data),
+        "aggregation": get_average_usage,
+        "aggregation_kwargs": {},
         "k": 4,
         "normalised": False,
         "ylabel": "Electricity usage (kWh)",
@@ -26,7 +30,8 @@ variants_dict = {
         "ymax": 4,
     },
     "normalised_usage": {
-        "df": get_average_usage(meter_data, normalised=True),
+        "aggregation": get_average_usage,
+        "aggregation_kwargs": {"normalised": True},
         "k": 4,
         "normalised": True,
         "ylabel": "Electricity usage (normalised)",
@@ -34,7 +39,8 @@ variants_dict = {
         "ymax": 0.2,
     },
     "weekday_weekend_diff": {
-        "df": get_daytype_diff(meter_data),
+        "aggregation": get_daytype_diff,
+        "aggregation_kwargs": {},
         "k": 3,
         "normalised": False,
         "ylabel": "Mean weekend usage - mean weekday usage (kWh)",
@@ -42,7 +48,8 @@ variants_dict = {
         "ymax": 1,
     },
     "weekday_weekend_ratio": {
-        "df": get_daytype_diff(meter_data, type="ratio"),
+        "aggregation": get_daytype_diff,
+        "aggregation_kwargs": {"type": "ratio"},
         "k": 2,
         "normalised": False,
         "ylabel": "Mean weekend usage / mean weekday usage",
@@ -50,7 +57,8 @@ variants_dict = {
         "ymax": 10,
     },
     "winter_summer_diff": {
-        "df": get_season_diff(meter_data),
+        "aggregation": get_season_diff,
+        "aggregation_kwargs": {},
         "k": 4,
         "normalised": False,
         "ylabel": "Mean winter usage - mean summer usage (kWh)",
@@ -58,19 +66,8 @@ variants_dict = {
         "ymax": 4,
     },
     "summer_rest_diff": {
-        "df": get_season_diff(
-            meter_data, season_1="summer", season_2="spring and autumn"
-        ),
-        "k": 4,
-        "normalised": False,
-        "ylabel": "Mean summer usage - mean spring/autumn usage (kWh)",
-        "ymin": -2,
-        "ymax": 1,
-    },
-    "summer_rest_diff": {
-        "df": get_season_diff(
-            meter_data, season_1="summer", season_2="spring and autumn"
-        ),
+        "aggregation": get_season_diff,
+        "aggregation_kwargs": {"season_1": "summer", "season_2": "spring and autumn"},
         "k": 4,
         "normalised": False,
         "ylabel": "Mean summer usage - mean spring/autumn usage (kWh)",
@@ -78,11 +75,127 @@ variants_dict = {
         "ymax": 1,
     },
     "cumulative_normalised": {
-        "df": get_average_usage(meter_data, normalised=True, cumulative=True),
+        "aggregation": get_average_usage,
+        "aggregation_kwargs": {"normalised": True, "cumulative": True},
         "k": 3,
         "normalised": True,
         "ylabel": "Cumulative normalised daily mean usage",
         "ymin": 0,
         "ymax": 1,
     },
+    # Robust and peak profiles. Values of k here are provisional until
+    # inertia plots have been reviewed for these variants.
+    "median_usage": {
+        "profile": "median",
+        "k": 4,
+        "normalised": False,
+        "ylabel": "Median electricity usage (kWh)",
+        "ymin": 0,
+        "ymax": 3,
+    },
+    "p90_usage": {
+        "profile": "p90",
+        "k": 4,
+        "normalised": False,
+        "ylabel": "90th percentile electricity usage (kWh)",
+        "ymin": 0,
+        "ymax": 5,
+    },
+    "p95_usage": {
+        "profile": "p95",
+        "k": 4,
+        "normalised": False,
+        "ylabel": "95th percentile electricity usage (kWh)",
+        "ymin": 0,
+        "ymax": 6,
+    },
+    "peak_day_usage": {
+        "profile": "peak_day",
+        "k": 4,
+        "normalised": False,
+        "ylabel": "Electricity usage on peak day (kWh)",
+        "ymin": 0,
+        "ymax": 6,
+    },
 }
+
+
+def get_variant_dfs(meter_data, variants=None):
+    """Produce the dataframe to cluster for each variant.
+
+    Args:
+        meter_data (pd.DataFrame): Smart meter data from `get_meter_data`.
+        variants (list, optional): Names of variants. Defaults to all variants.
+
+    Returns:
+        dict: Dataframes keyed by variant name.
+    """
+    if variants is None:
+        variants = list(variant_specs.keys())
+
+    profiles = [
+        variant_specs[v]["profile"] for v in variants if "profile" in variant_specs[v]
+    ]
+    if profiles:
+        usage_profiles = get_usage_profiles(meter_data)
+
+    variant_dfs = {}
+    for variant in variants:
+        spec = variant_specs[variant]
+        if "profile" in spec:
+            variant_dfs[variant] = usage_profiles[spec["profile"]]
+        else:
+            variant_dfs[variant] = spec["aggregation"](
+                meter_data, **spec["aggregation_kwargs"]
+            )
+
+    return variant_dfs
+
+
+def aggregation_params(variant):
+    """Description of the settings that determine a variant's dataframe.
+
+    Args:
+        variant (str): Name of variant.
+
+    Returns:
+        str: Aggregation and keyword arguments.
+    """
+    spec = variant_specs[variant]
+    aggregation = spec.get("profile") or spec["aggregation"].__name__
+
+    return f"{aggregation} {spec.get('aggregation_kwargs', {})}"
+
+
+def variant_params(variant):
+    """Description of the settings that determine a variant's dataframe and clusters.
+
+    Args:
+        variant (str): Name of variant.
+
+    Returns:
+        str: Aggregation, keyword arguments and k.
+    """
+    return f"{aggregation_params(variant)} k={variant_specs[variant]['k']}"
+
+
+def _build_variants_dict():
+    """Load the smart meter data and pair each variant's dataframe with its
+    parameters."""
+    from asf_smart_meter_exploration.getters.get_processed_data import get_meter_data
+
+    variant_dfs = get_variant_dfs(get_meter_data())
+
+    return {
+        variant: {"df": variant_dfs[variant], **spec}
+        for variant, spec in variant_specs.items()
+    }
+
+
+def __getattr__(name):
+    # `variants_dict` needs the full smart meter data, so only build it when first used
+    if name == "variants_dict":
+        global variants_dict
+        variants_dict = _build_variants_dict()
+        return variants_dict
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
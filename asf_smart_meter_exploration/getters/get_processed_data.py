@@ -4,7 +4,9 @@ Functions to get smart meter and household contextual data.
 """
 
 import pandas as pd
+import json
 import os
+from functools import lru_cache
 
 from asf_smart_meter_exploration import base_config, PROJECT_DIR
 from asf_smart_meter_exploration.pipeline.process_raw_data import (
@@ -13,6 +15,14 @@ from asf_smart_meter_exploration.pipeline.process_raw_data import (
 
 household_data_file_path = PROJECT_DIR / base_config["household_data_file_path"]
 meter_data_merged_file_path = PROJECT_DIR / base_config["meter_data_merged_file_path"]
+quality_report_file_path = PROJECT_DIR / base_config["quality_report_file_path"]
+meter_data_chunksize = base_config["meter_data_chunksize"]
+variant_data_folder_path = PROJECT_DIR / base_config["variant_data_folder_path"]
+cluster_labels_folder_path = PROJECT_DIR / base_config["cluster_labels_folder_path"]
+daily_archetypes_file_path = PROJECT_DIR / base_config["daily_archetypes_file_path"]
+daily_archetype_histograms_file_path = (
+    PROJECT_DIR / base_config["daily_archetype_histograms_file_path"]
+)
 
 
 def get_household_data():
@@ -27,6 +37,21 @@ def get_household_data():
     return pd.read_csv(household_data_file_path)
 
 
+@lru_cache(maxsize=None)
+def get_household_metadata():
+    """Get household contextual data indexed by household ID, with categorical columns.
+    The file is only read once per session, so the returned dataframe is shared
+    between callers and should not be modified.
+
+    Returns:
+        pd.DataFrame: Household data indexed by LCLid.
+    """
+    household_data = get_household_data().set_index("LCLid")
+    categorical_columns = household_data.select_dtypes(exclude="number").columns
+
+    return household_data.astype({column: "category" for column in categorical_columns})
+
+
 def get_meter_data():
     """Get all household smart meter data (half-hourly electricity usage).
 
@@ -41,3 +66,142 @@ def get_meter_data():
     meter_data["time"] = meter_data["tstp"].dt.time
 
     return meter_data
+
+
+def get_meter_data_chunks(chunksize=meter_data_chunksize):
+    """Get household smart meter data as an iterator of row chunks, so that it
+    can be processed without loading the whole file into memory.
+
+    Args:
+        chunksize (int, optional): Number of timestamps (rows) per chunk.
+            Defaults to `meter_data_chunksize` in base config.
+
+    Yields:
+        pd.DataFrame: Chunk of smart meter data, in timestamp order.
+    """
+    if not os.path.isfile(meter_data_merged_file_path):
+        produce_all_properties_df()
+
+    for chunk in pd.read_csv(meter_data_merged_file_path, chunksize=chunksize):
+        chunk["tstp"] = pd.to_datetime(chunk["tstp"])
+        chunk["time"] = chunk["tstp"].dt.time
+        yield chunk
+
+
+def get_quality_report():
+    """Get the data quality report produced when processing the raw data
+    (see `pipeline/data_quality.py`).
+
+    Returns:
+        pd.DataFrame: Completeness, duplicate, off-grid, outlier and gap filling
+            counts, with households as rows.
+    """
+    if not os.path.isfile(quality_report_file_path):
+        produce_all_properties_df()
+
+    return pd.read_csv(
+        quality_report_file_path,
+        index_col="LCLid",
+        parse_dates=["first_reading", "last_reading"],
+    )
+
+
+def get_daily_archetypes():
+    """Get archetype daily load shapes found by clustering household-days.
+
+    Returns:
+        pd.DataFrame: Archetypes as rows, with a column for each half hour.
+    """
+    if not os.path.isfile(daily_archetypes_file_path):
+        from asf_smart_meter_exploration.pipeline.daily_profiles import (
+            produce_daily_archetypes,
+        )
+
+        produce_daily_archetypes()
+
+    archetypes = pd.read_csv(daily_archetypes_file_path, index_col="archetype")
+    archetypes.columns = pd.to_datetime(archetypes.columns, format="%H:%M:%S").time
+
+    return archetypes
+
+
+def get_daily_archetype_histograms():
+    """Get the proportion of each household's days assigned to each daily archetype.
+
+    Returns:
+        pd.DataFrame: Archetype proportions, with households as rows.
+    """
+    if not os.path.isfile(daily_archetype_histograms_file_path):
+        from asf_smart_meter_exploration.pipeline.daily_profiles import (
+            produce_daily_archetypes,
+        )
+
+        produce_daily_archetypes()
+
+    histograms = pd.read_csv(daily_archetype_histograms_file_path, index_col="LCLid")
+    histograms.index.name = None
+
+    return histograms
+
+
+def get_variant_data(variant):
+    """Get the saved dataframe for a clustering variant (produced by
+    `smartmeter run aggregate`).
+
+    Args:
+        variant (str): Name of variant.
+
+    Returns:
+        pd.DataFrame: Variant data, with households as rows.
+    """
+    file_path = variant_data_folder_path / (variant + ".pkl")
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(
+            f"{file_path} not found. Please run `smartmeter run aggregate`."
+        )
+
+    return pd.read_pickle(file_path)
+
+
+def get_variant_clusters(variant):
+    """Get the saved cluster assignments for a clustering variant (produced by
+    `smartmeter run cluster`).
+
+    Args:
+        variant (str): Name of variant.
+
+    Returns:
+        pd.Series: Cluster of each household, indexed by LCLid.
+    """
+    file_path = cluster_labels_folder_path / (variant + ".csv")
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(
+            f"{file_path} not found. Please run `smartmeter run cluster`."
+        )
+
+    return pd.read_csv(file_path, index_col="LCLid")["cluster"]
+
+
+def get_variant_cluster_model(variant):
+    """Get the saved cluster centroids and feature recipe for a clustering variant
+    (produced by `smartmeter run cluster`).
+
+    Args:
+        variant (str): Name of variant.
+
+    Returns:
+        tuple: Recipe (dict, see `pipeline/incremental_features.py`) and
+            centroids (pd.DataFrame with a row per cluster).
+    """
+    centroids_file_path = cluster_labels_folder_path / (variant + "_centroids.csv")
+    recipe_file_path = cluster_labels_folder_path / (variant + "_recipe.json")
+    if not (os.path.isfile(centroids_file_path) and os.path.isfile(recipe_file_path)):
+        raise FileNotFoundError(
+            f"Cluster model for {variant} not found. "
+            "Please run `smartmeter run cluster`."
+        )
+
+    with open(recipe_file_path) as f:
+        recipe = json.load(f)
+
+    return recipe, pd.read_csv(centroids_file_path, index_col="cluster")
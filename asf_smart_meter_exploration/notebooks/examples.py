@@ -17,11 +17,6 @@
 # %% [markdown]
 # ## Setup
 
-# %%
-import os
-
-os.chdir("../..")
-
 # %%
 import pandas as pd
 
@@ -55,4 +50,9 @@ produce_inertia_plots()
 # %%
 cluster_and_plot_all_variants()
 
+# %% [markdown]
+# The same steps can be run from the command line, skipping any steps whose outputs are already up to date:
+#
+# `smartmeter run inertia plot --variants total_usage normalised_usage`
+
 # %%
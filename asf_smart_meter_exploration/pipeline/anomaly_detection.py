@@ -0,0 +1,201 @@
+# File: asf_smart_meter_exploration/pipeline/anomaly_detection.py
+"""
+Script to flag days whose load shape deviates strongly from the household's own
+cluster centroid (e.g. after adopting an EV or heat pump).
+
+Readings are consumed in time order and each household-day is scored once the
+day is complete. Each day's distance from the centroid is compared with an
+exponentially weighted mean and variance of the household's previous distances,
+kept in compact per-household arrays, so memory does not grow with the number
+of days processed. Days more than `anomaly_threshold` standard deviations above
+the household's usual distance are reported.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration import PROJECT_DIR, base_config
+from asf_smart_meter_exploration.pipeline.data_aggregation import iter_daily_usage
+
+anomalies_folder_path = PROJECT_DIR / base_config["anomalies_folder_path"]
+anomaly_variant = base_config["anomaly_variant"]
+anomaly_threshold = base_config["anomaly_threshold"]
+anomaly_halflife_days = base_config["anomaly_halflife_days"]
+anomaly_warmup_days = base_config["anomaly_warmup_days"]
+
+
+class AnomalyDetector:
+    """Scores household-days against each household's cluster centroid.
+
+    Args:
+        households (pd.Index): Household IDs.
+        clusters (array-like): Cluster of each household.
+        centroids (np.ndarray): Cluster centroids, with a column per half hour.
+        recipe (dict): Feature recipe of the variant the centroids belong to
+            (see `pipeline/incremental_features.py`). Only `get_average_usage`
+            variants describe a single day, so only these are supported.
+        threshold (float, optional): Number of standard deviations above the
+            household's usual distance for a day to be anomalous.
+            Defaults to `anomaly_threshold` in base config.
+        halflife_days (float, optional): Half-life of the rolling statistics.
+            Defaults to `anomaly_halflife_days` in base config.
+        warmup_days (int, optional): Days a household must be seen before its days
+            can be anomalous. Defaults to `anomaly_warmup_days` in base config.
+    """
+
+    def __init__(
+        self,
+        households,
+        clusters,
+        centroids,
+        recipe,
+        threshold=anomaly_threshold,
+        halflife_days=anomaly_halflife_days,
+        warmup_days=anomaly_warmup_days,
+    ):
+        if recipe["aggregation"] != "get_average_usage":
+            raise ValueError(
+                recipe["aggregation"] + " variants cannot be compared with single days."
+            )
+        self.normalised = recipe["aggregation_kwargs"].get("normalised", False)
+        self.cumulative = recipe["aggregation_kwargs"].get("cumulative", False)
+
+        self.households = pd.Index(households)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.clusters = np.asarray(clusters, dtype=np.int32)
+        self.threshold = threshold
+        self.alpha = 1 - 0.5 ** (1 / halflife_days)
+        self.warmup_days = warmup_days
+
+        n_households = len(self.households)
+        self.days_seen = np.zeros(n_households, dtype=np.int32)
+        self.mean_distance = np.zeros(n_households, dtype=np.float32)
+        self.var_distance = np.zeros(n_households, dtype=np.float32)
+
+        self._day_index = None
+        self._positions = None
+
+    @classmethod
+    def from_variant(cls, variant=anomaly_variant, **kwargs):
+        """Create a detector from a variant's saved clusters (see
+        `smartmeter run cluster`).
+
+        Args:
+            variant (str, optional): Name of variant.
+                Defaults to `anomaly_variant` in base config.
+            **kwargs: Passed to `AnomalyDetector`.
+
+        Returns:
+            AnomalyDetector: Detector for the variant.
+        """
+        from asf_smart_meter_exploration.getters.get_processed_data import (
+            get_variant_cluster_model,
+            get_variant_clusters,
+        )
+
+        recipe, centroids = get_variant_cluster_model(variant)
+        clusters = get_variant_clusters(variant)
+
+        return cls(
+            clusters.index, clusters.to_numpy(), centroids.to_numpy(), recipe, **kwargs
+        )
+
+    def score_day(self, date, day):
+        """Score one complete day and update the rolling statistics.
+
+        Args:
+            date (datetime.date): Date of the readings.
+            day (pd.DataFrame): Readings with households as rows and a column per
+                half hour, as yielded by `iter_daily_usage`.
+
+        Returns:
+            pd.DataFrame: Anomalous households with their distance and score.
+        """
+        # Households are usually in the same order every day, so only realign
+        # them when the day's households change
+        if self._day_index is None or not day.index.equals(self._day_index):
+            self._day_index = day.index
+            self._positions = day.index.get_indexer(self.households)
+
+        values = day.to_numpy(dtype=np.float32)
+        values = np.where(
+            (self._positions >= 0)[:, None], values[self._positions], np.nan
+        )
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if self.normalised:
+                values = values / values.sum(axis=1, keepdims=True)
+            if self.cumulative:
+                values = values.cumsum(axis=1)
+
+        complete = np.flatnonzero(np.isfinite(values).all(axis=1))
+        distances = np.linalg.norm(
+            values[complete] - self.centroids[self.clusters[complete]], axis=1
+        )
+
+        mean = self.mean_distance[complete]
+        var = self.var_distance[complete]
+        days_seen = self.days_seen[complete]
+        scores = (distances - mean) / np.sqrt(var + 1e-12)
+        anomalous = (days_seen >= self.warmup_days) & (scores > self.threshold)
+
+        # Exponentially weighted mean and variance, using a plain running mean
+        # until a household has been seen for longer than the half-life
+        alpha = np.maximum(self.alpha, 1 / (days_seen + 1))
+        delta = distances - mean
+        self.mean_distance[complete] = mean + alpha * delta
+        self.var_distance[complete] = (1 - alpha) * (var + alpha * delta**2)
+        self.days_seen[complete] += 1
+
+        return pd.DataFrame(
+            {
+                "date": date,
+                "LCLid": self.households[complete[anomalous]],
+                "distance": distances[anomalous],
+                "score": scores[anomalous],
+            }
+        )
+
+    def process(self, data):
+        """Score every complete day in time order.
+
+        Args:
+            data (pd.DataFrame or iterable of pd.DataFrame): Dataset of meter readings,
+                or chunks of it in timestamp order (e.g. from `get_meter_data_chunks`).
+
+        Yields:
+            pd.DataFrame: Anomalies found on each day (may be empty).
+        """
+        for date, day in iter_daily_usage(data):
+            yield self.score_day(date, day)
+
+
+def produce_anomalies(variant=anomaly_variant):
+    """Detect anomalous days over the processed meter data and save them as a CSV file.
+    Anomalies are appended to the file as they are found.
+
+    Args:
+        variant (str, optional): Name of variant whose clusters to compare against.
+            Defaults to `anomaly_variant` in base config.
+    """
+    from asf_smart_meter_exploration.getters.get_processed_data import (
+        get_meter_data_chunks,
+    )
+
+    if not os.path.isdir(anomalies_folder_path):
+        os.makedirs(anomalies_folder_path)
+    file_path = anomalies_folder_path / (variant + ".csv")
+
+    detector = AnomalyDetector.from_variant(variant)
+    pd.DataFrame(columns=["date", "LCLid", "distance", "score"]).to_csv(
+        file_path, index=False
+    )
+    for anomalies in detector.process(get_meter_data_chunks()):
+        if len(anomalies) > 0:
+            anomalies.to_csv(file_path, mode="a", header=False, index=False)
+
+
+if __name__ == "__main__":
+    produce_anomalies()
@@ -0,0 +1,416 @@
+# File: asf_smart_meter_exploration/pipeline/cluster_service.py
+"""
+Local HTTP service that assigns households to clusters as their readings arrive.
+
+At startup the saved centroids and feature recipe of each variant are loaded
+(see `smartmeter run cluster`). Each request posts half-hourly readings for one or
+more households; these are added to running per-household sums and the households'
+variant features are rebuilt from the sums and matched to the nearest centroid.
+Concurrent requests are collected into micro-batches so that the readings of
+the whole batch are added in one update and all households are labelled with
+one vectorised distance computation per variant.
+
+Example request (POST /assign):
+
+    {"variant": "total_usage",
+     "readings": [{"LCLid": "MAC000002", "tstp": "2014-02-27 00:00:00",
+                   "energy": 0.12}]}
+
+Response:
+
+    {"variant": "total_usage",
+     "labels": {"MAC000002": {"cluster": 1, "distance": 0.35}}}
+
+Households whose features cannot be computed yet (e.g. no readings for some
+half hours) get a null cluster. Malformed requests (including readings whose
+timestamps are not on the half hour) get a 400 response without affecting other
+requests in the same batch.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration import base_config
+from asf_smart_meter_exploration.config.plot_variants import variant_specs
+from asf_smart_meter_exploration.getters.get_processed_data import (
+    get_meter_data_chunks,
+    get_variant_cluster_model,
+)
+from asf_smart_meter_exploration.pipeline.incremental_features import (
+    HouseholdProfileAccumulator,
+)
+from asf_smart_meter_exploration.utils.clustering_utils import nearest_centroids
+
+cluster_service_host = base_config["cluster_service_host"]
+cluster_service_port = base_config["cluster_service_port"]
+cluster_service_max_batch = base_config["cluster_service_max_batch"]
+cluster_service_max_wait_ms = base_config["cluster_service_max_wait_ms"]
+cluster_service_timeout_s = base_config["cluster_service_timeout_s"]
+
+
+class ClusterAssigner:
+    """Holds running household sums and the cluster model of each variant.
+
+    Args:
+        variants (list): Names of variants with saved cluster models.
+        accumulator (HouseholdProfileAccumulator, optional): Running sums to start
+            from. Defaults to an empty accumulator.
+    """
+
+    def __init__(self, variants, accumulator=None):
+        self.accumulator = accumulator or HouseholdProfileAccumulator()
+        self.models = {}
+
+        for variant in variants:
+            recipe, centroids = get_variant_cluster_model(variant)
+            if recipe["aggregation"].startswith("profile:"):
+                print(f"Skipping {variant}: profiles cannot be built incrementally.")
+                continue
+            self.models[variant] = (recipe, centroids.to_numpy())
+
+    def assign(self, variant, lclids):
+        """Assign households to their nearest cluster for a variant.
+
+        Args:
+            variant (str): Name of variant.
+            lclids (list): Household IDs.
+
+        Returns:
+            tuple: Cluster of each household (-1 if its features are incomplete)
+                and distance to the cluster centroid (NaN if incomplete).
+        """
+        if variant not in self.models:
+            raise ValueError(f"No cluster model loaded for {variant}.")
+        recipe, centroids = self.models[variant]
+
+        clusters = np.full(len(lclids), -1)
+        distances = np.full(len(lclids), np.nan)
+
+        rows = self.accumulator.rows(lclids)
+        known = np.flatnonzero(rows >= 0)
+        features = self.accumulator.features(recipe, rows[known])
+        complete = ~np.isnan(features).any(axis=1)
+
+        if complete.any():
+            nearest, distance = nearest_centroids(features[complete], centroids)
+            clusters[known[complete]] = nearest
+            distances[known[complete]] = distance
+
+        return clusters, distances
+
+
+class MicroBatcher:
+    """Collects concurrent requests and processes them together on one worker thread.
+
+    A batch is processed once it has `max_batch` requests or the first request in it
+    has waited `max_wait_ms`, whichever comes first.
+
+    Args:
+        assigner (ClusterAssigner): Assigner used for every batch.
+        max_batch (int, optional): Maximum requests per batch.
+            Defaults to `cluster_service_max_batch` in base config.
+        max_wait_ms (float, optional): Maximum time to wait for a batch to fill.
+            Defaults to `cluster_service_max_wait_ms` in base config.
+    """
+
+    def __init__(
+        self,
+        assigner,
+        max_batch=cluster_service_max_batch,
+        max_wait_ms=cluster_service_max_wait_ms,
+    ):
+        self.assigner = assigner
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def submit(self, variant, lclids, tstps, values, households=()):
+        """Queue readings and a request for cluster labels.
+
+        Args:
+            variant (str): Name of variant.
+            lclids (list): Household ID of each reading.
+            tstps (np.ndarray): Timestamp (datetime64) of each reading.
+            values (np.ndarray): Usage (kWh) of each reading.
+            households (list, optional): Further households to label without
+                new readings. Defaults to ().
+
+        Returns:
+            Future: Resolves to a dict of {household ID: (cluster, distance)}.
+        """
+        future = Future()
+        self._queue.put((variant, lclids, tstps, values, households, future))
+        return future
+
+    def close(self):
+        """Stop the worker thread once queued requests are processed."""
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        """Worker loop: gather a batch, then process it."""
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._process(batch)
+
+    def _process(self, batch):
+        """Add all readings in the batch, then label households variant by variant.
+        Every request is resolved, with an exception if it could not be processed,
+        so that the worker keeps running and waiting requests are not left hanging.
+        """
+        try:
+            batch = self._add_readings(batch)
+
+            by_variant = {}
+            for item in batch:
+                by_variant.setdefault(item[0], []).append(item)
+
+            for variant, items in by_variant.items():
+                try:
+                    self._label(variant, items)
+                except Exception as error:
+                    _fail_requests(items, error)
+        except Exception as error:
+            _fail_requests(batch, error)
+
+    def _add_readings(self, batch):
+        """Add the readings of all requests in one update. If that fails, add them
+        request by request so that only requests with bad readings fail.
+
+        Returns:
+            list: Requests whose readings were added.
+        """
+        try:
+            self._add_request_readings(batch)
+            return batch
+        except Exception as error:
+            if len(batch) == 1:
+                _fail_requests(batch, error)
+                return []
+
+        added = []
+        for item in batch:
+            try:
+                self._add_request_readings([item])
+                added.append(item)
+            except Exception as error:
+                _fail_requests([item], error)
+
+        return added
+
+    def _add_request_readings(self, items):
+        """Add the readings of the given requests to the running sums."""
+        lclids = [lclid for item in items for lclid in item[1]]
+        if lclids:
+            self.assigner.accumulator.add_readings(
+                lclids,
+                np.concatenate([item[2] for item in items]),
+                np.concatenate([item[3] for item in items]),
+            )
+
+    def _label(self, variant, items):
+        """Label the households of the given requests for a variant."""
+        households = list(
+            dict.fromkeys(lclid for item in items for lclid in [*item[1], *item[4]])
+        )
+        clusters, distances = self.assigner.assign(variant, households)
+
+        labels = dict(zip(households, zip(clusters.tolist(), distances.tolist())))
+        for _, item_lclids, _, _, item_households, future in items:
+            future.set_result(
+                {
+                    lclid: labels[lclid]
+                    for lclid in dict.fromkeys([*item_lclids, *item_households])
+                }
+            )
+
+
+def _fail_requests(items, error):
+    """Resolve any unresolved requests with an exception."""
+    for *_, future in items:
+        if not future.done():
+            future.set_exception(error)
+
+
+def parse_assign_request(body):
+    """Check and convert the body of a POST /assign request.
+
+    Args:
+        body (dict): Parsed JSON body (see the example at the top of this module).
+
+    Returns:
+        tuple: Arguments for `MicroBatcher.submit` (variant, household ID and
+            timestamp and usage of each reading, and further households).
+
+    Raises:
+        ValueError: if the request is malformed.
+    """
+    if not isinstance(body, dict) or not isinstance(body.get("variant"), str):
+        raise ValueError('"variant" must be a string.')
+
+    readings = body.get("readings", [])
+    households = body.get("households", [])
+    if not isinstance(readings, list) or not all(
+        isinstance(reading, dict) for reading in readings
+    ):
+        raise ValueError('"readings" must be a list of objects.')
+    if not isinstance(households, list):
+        raise ValueError('"households" must be a list.')
+
+    lclids = [reading["LCLid"] for reading in readings]
+    if not all(isinstance(lclid, str) for lclid in [*lclids, *households]):
+        raise ValueError("Household IDs must be strings.")
+
+    tstps = pd.to_datetime([reading["tstp"] for reading in readings])
+    if tstps.isna().any():
+        raise ValueError("Reading timestamps must not be null.")
+    if (tstps != tstps.floor("30min")).any():
+        raise ValueError("Reading timestamps must be on the half hour.")
+    values = np.array([reading["energy"] for reading in readings], dtype=float)
+
+    return body["variant"], lclids, tstps.to_numpy(), values, households
+
+
+class AssignmentServer(ThreadingHTTPServer):
+    """HTTP server with a listen backlog large enough for many concurrent clients."""
+
+    request_queue_size = 256
+    daemon_threads = True
+    timeout_s = cluster_service_timeout_s
+
+
+class AssignmentRequestHandler(BaseHTTPRequestHandler):
+    """Handles POST /assign and GET /health requests."""
+
+    def do_GET(self):
+        """Respond to GET /health with the variants being served."""
+        if self.path != "/health":
+            self._respond(404, {"error": "Not found."})
+            return
+        self._respond(200, {"variants": list(self.server.batcher.assigner.models)})
+
+    def do_POST(self):
+        """Respond to POST /assign with the cluster label of each household in the
+        request, once its micro-batch has been processed."""
+        if self.path != "/assign":
+            self._respond(404, {"error": "Not found."})
+            return
+
+        try:
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            # Parse in the request thread so that bad input only fails this request
+            variant, *readings = parse_assign_request(body)
+        except (KeyError, TypeError, ValueError) as error:
+            self._respond(400, {"error": str(error)})
+            return
+
+        try:
+            labels = self.server.batcher.submit(variant, *readings).result(
+                timeout=self.server.timeout_s
+            )
+        except TimeoutError:
+            self._respond(503, {"error": "Timed out waiting for cluster labels."})
+            return
+        except ValueError as error:
+            self._respond(400, {"error": str(error)})
+            return
+        except Exception as error:
+            self._respond(500, {"error": str(error)})
+            return
+
+        self._respond(
+            200,
+            {
+                "variant": variant,
+                "labels": {
+                    lclid: {
+                        "cluster": None if cluster < 0 else cluster,
+                        "distance": None if cluster < 0 else distance,
+                    }
+                    for lclid, (cluster, distance) in labels.items()
+                },
+            },
+        )
+
+    def _respond(self, status, content):
+        """Send a JSON response."""
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        """Skip per-request logging, which would dominate latency under load."""
+
+
+def serve(
+    variants=None, host=cluster_service_host, port=cluster_service_port, seed=False
+):
+    """Start the cluster assignment service.
+
+    Args:
+        variants (list, optional): Variants to serve. Defaults to all variants
+            with saved cluster models.
+        host (str, optional): Host to bind to. Defaults to `cluster_service_host`
+            in base config.
+        port (int, optional): Port to bind to. Defaults to `cluster_service_port`
+            in base config.
+        seed (bool, optional): Whether to start from the running sums of the full
+            processed meter data, rather than only readings sent to the service.
+            Defaults to False.
+    """
+    from asf_smart_meter_exploration.pipeline.stages import centroids_file
+
+    if variants is None:
+        variants = [v for v in variant_specs if os.path.isfile(centroids_file(v))]
+
+    assigner = ClusterAssigner(variants)
+    if seed:
+        print("Adding processed meter data to running sums...")
+        for chunk in get_meter_data_chunks():
+            assigner.accumulator.add_meter_data(chunk)
+
+    server = AssignmentServer((host, port), AssignmentRequestHandler)
+    server.batcher = MicroBatcher(assigner)
+
+    print(f"Serving cluster assignments on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    finally:
+        server.batcher.close()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,264 @@
+# File: asf_smart_meter_exploration/pipeline/daily_profiles.py
+"""
+Script to cluster individual household-days into "archetype" daily load shapes
+and describe each household as a mixture of these archetypes.
+Household-day vectors are streamed in batches, so the full set of ~4M days
+is never held in memory at once.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration import base_config, PROJECT_DIR
+from asf_smart_meter_exploration.getters.get_processed_data import (
+    get_meter_data_chunks,
+)
+from asf_smart_meter_exploration.pipeline.data_aggregation import (
+    half_hours,
+    iter_daily_usage,
+)
+
+meter_data_merged_folder_path = (
+    PROJECT_DIR / base_config["meter_data_merged_folder_path"]
+)
+daily_archetypes_file_path = PROJECT_DIR / base_config["daily_archetypes_file_path"]
+daily_archetype_histograms_file_path = (
+    PROJECT_DIR / base_config["daily_archetype_histograms_file_path"]
+)
+daily_archetypes_k = base_config["daily_archetypes_k"]
+daily_archetypes_batch_size = base_config["daily_archetypes_batch_size"]
+daily_archetypes_shuffle_batches = base_config["daily_archetypes_shuffle_batches"]
+daily_archetypes_n_jobs = base_config["daily_archetypes_n_jobs"]
+random_state = base_config["random_state"]
+
+
+def iter_household_day_batches(
+    data, batch_size=daily_archetypes_batch_size, normalised=True
+):
+    """Stream complete household-days as batches of 48-dimensional vectors.
+    Days with any missing reading (or zero usage, if normalising) are skipped.
+
+    Args:
+        data (pd.DataFrame or iterable of pd.DataFrame): Dataset of meter readings,
+            or chunks of it in timestamp order.
+        batch_size (int, optional): Approximate number of household-days per batch.
+            Defaults to `daily_archetypes_batch_size` in base config.
+        normalised (bool, optional): Whether to divide each day by its total usage so
+            that days are compared by shape rather than amount. Defaults to True.
+
+    Yields:
+        tuple: Household IDs (pd.Index, the same object for every batch),
+            positions of each vector's household in those IDs (np.ndarray)
+            and the household-day vectors (np.ndarray).
+    """
+    households = None
+    positions, vectors, n_buffered = [], [], 0
+
+    for _, day in iter_daily_usage(data):
+        if households is None:
+            households = day.index
+        values = day.to_numpy(dtype=np.float32)
+
+        keep = ~np.isnan(values).any(axis=1)
+        if normalised:
+            totals = values.sum(axis=1)
+            keep &= totals > 0
+            values = values / np.where(keep, totals, 1)[:, None]
+
+        positions.append(np.flatnonzero(keep))
+        vectors.append(values[keep])
+        n_buffered += keep.sum()
+
+        if n_buffered >= batch_size:
+            yield households, np.concatenate(positions), np.concatenate(vectors)
+            positions, vectors, n_buffered = [], [], 0
+
+    if n_buffered > 0:
+        yield households, np.concatenate(positions), np.concatenate(vectors)
+
+
+def iter_shuffled_batches(
+    batches,
+    batch_size=daily_archetypes_batch_size,
+    shuffle_batches=daily_archetypes_shuffle_batches,
+):
+    """Mix vectors from batches in date order through a shuffle buffer, so that
+    each batch yielded is drawn from across many days rather than a few consecutive
+    ones. Each incoming vector replaces a random vector in the buffer, which is
+    yielded instead.
+
+    Args:
+        batches (iterable of np.ndarray): Batches of vectors.
+        batch_size (int, optional): Size of the batches left in the buffer at the end.
+            Defaults to `daily_archetypes_batch_size` in base config.
+        shuffle_batches (int, optional): Size of the buffer in batches.
+            Defaults to `daily_archetypes_shuffle_batches` in base config.
+
+    Yields:
+        np.ndarray: Batches of vectors.
+    """
+    rng = np.random.default_rng(random_state)
+    capacity = shuffle_batches * batch_size
+    buffer, n_filled = None, 0
+
+    for vectors in batches:
+        if buffer is None:
+            buffer = np.empty((capacity, vectors.shape[1]), dtype=vectors.dtype)
+
+        n_fill = min(capacity - n_filled, len(vectors))
+        buffer[n_filled : n_filled + n_fill] = vectors[:n_fill]
+        n_filled += n_fill
+
+        for start in range(n_fill, len(vectors), capacity):
+            incoming = vectors[start : start + capacity]
+            slots = rng.choice(capacity, len(incoming), replace=False)
+            evicted = buffer[slots]
+            buffer[slots] = incoming
+            yield evicted
+
+    if buffer is not None:
+        remaining = buffer[:n_filled]
+        rng.shuffle(remaining)
+        for start in range(0, n_filled, batch_size):
+            yield remaining[start : start + batch_size]
+
+
+def fit_daily_archetypes(data, k=daily_archetypes_k, normalised=True):
+    """Fit mini-batch k-means to household-day vectors in a single streaming pass.
+    Household-days are mixed through a shuffle buffer (see `iter_shuffled_batches`) so
+    that the centroids are not biased towards the season the data starts in.
+
+    Args:
+        data (pd.DataFrame or iterable of pd.DataFrame): Dataset of meter readings,
+            or chunks of it in timestamp order.
+        k (int, optional): Number of archetypes. Defaults to `daily_archetypes_k`
+            in base config.
+        normalised (bool, optional): Whether to cluster on daily shape.
+            Defaults to True.
+
+    Returns:
+        MiniBatchKMeans: Fitted model.
+
+    Raises:
+        ValueError: if there are fewer than k complete household-days.
+    """
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(n_clusters=k, random_state=random_state, n_init=3)
+    fitted = False
+
+    batches = (
+        vectors
+        for _, _, vectors in iter_household_day_batches(data, normalised=normalised)
+    )
+    for vectors in iter_shuffled_batches(batches):
+        # The first call initialises the centroids so needs at least k samples
+        if fitted or len(vectors) >= k:
+            kmeans.partial_fit(vectors)
+            fitted = True
+
+    if not fitted:
+        raise ValueError(f"Fewer than {k} complete household-days found.")
+
+    return kmeans
+
+
+def assign_daily_archetypes(
+    data, kmeans, normalised=True, n_jobs=daily_archetypes_n_jobs
+):
+    """Assign every household-day to its nearest archetype and count the
+    assignments for each household. Batches are labelled concurrently.
+
+    Args:
+        data (pd.DataFrame or iterable of pd.DataFrame): Dataset of meter readings,
+            or chunks of it in timestamp order.
+        kmeans (MiniBatchKMeans): Fitted model from `fit_daily_archetypes`.
+        normalised (bool, optional): Whether the model was fitted on daily shape.
+            Defaults to True.
+        n_jobs (int, optional): Number of batches to label at once.
+            Defaults to `daily_archetypes_n_jobs` in base config.
+
+    Returns:
+        pd.DataFrame: Number of days assigned to each archetype, with households
+            as rows and a column for each archetype.
+    """
+    k = kmeans.n_clusters
+    households, counts = None, None
+
+    def label(positions, vectors):
+        return positions, kmeans.predict(vectors)
+
+    def collect(future):
+        positions, labels = future.result()
+        np.add.at(counts, (positions, labels), 1)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        pending = []
+        for batch_households, positions, vectors in iter_household_day_batches(
+            data, normalised=normalised
+        ):
+            if households is None:
+                households = batch_households
+                counts = np.zeros((len(households), k), dtype=np.int64)
+
+            pending.append(executor.submit(label, positions, vectors))
+            # Bound the number of batches held in memory
+            if len(pending) >= 2 * n_jobs:
+                collect(pending.pop(0))
+
+        for future in pending:
+            collect(future)
+
+    if households is None:
+        raise ValueError("No complete household-days found.")
+
+    return pd.DataFrame(counts, index=households, columns=range(k))
+
+
+def archetype_histograms(archetype_counts):
+    """Convert archetype counts to the proportion of each household's days in each
+    archetype. Households with no complete days are dropped.
+
+    Args:
+        archetype_counts (pd.DataFrame): Output of `assign_daily_archetypes`.
+
+    Returns:
+        pd.DataFrame: Archetype proportions, with households as rows.
+    """
+    return archetype_counts.div(archetype_counts.sum(axis=1), axis=0).dropna(axis=0)
+
+
+def produce_daily_archetypes(k=daily_archetypes_k, normalised=True):
+    """Fit daily archetypes over the processed meter data and save the archetypes
+    and per-household archetype histograms as CSV files.
+
+    Args:
+        k (int, optional): Number of archetypes. Defaults to `daily_archetypes_k`
+            in base config.
+        normalised (bool, optional): Whether to cluster on daily shape.
+            Defaults to True.
+    """
+    print("Fitting daily archetypes...")
+    kmeans = fit_daily_archetypes(get_meter_data_chunks(), k=k, normalised=normalised)
+
+    print("Assigning household-days to archetypes...")
+    counts = assign_daily_archetypes(
+        get_meter_data_chunks(), kmeans, normalised=normalised
+    )
+
+    if not os.path.isdir(meter_data_merged_folder_path):
+        os.makedirs(meter_data_merged_folder_path)
+
+    pd.DataFrame(kmeans.cluster_centers_, columns=half_hours).to_csv(
+        daily_archetypes_file_path, index_label="archetype"
+    )
+    archetype_histograms(counts).to_csv(
+        daily_archetype_histograms_file_path, index_label="LCLid"
+    )
+
+
+if __name__ == "__main__":
+    produce_daily_archetypes()
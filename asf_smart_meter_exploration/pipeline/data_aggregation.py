@@ -3,10 +3,17 @@
 Functions to process household smart meter data into various formats for clustering.
 """
 
+import datetime
+
 import numpy as np
-import holidays
+import pandas as pd
+
+from asf_smart_meter_exploration.getters.get_processed_data import (
+    get_household_metadata,
+)
+from asf_smart_meter_exploration.utils.quantile_utils import P2QuantileSketch
 
-from asf_smart_meter_exploration.getters.get_processed_data import get_household_data
+half_hours = [datetime.time(h, m) for h in range(24) for m in (0, 30)]
 
 
 def get_average_usage(data, normalised=False, cumulative=False):
@@ -36,6 +43,129 @@ def get_average_usage(data, normalised=False, cumulative=False):
     return hh_averages
 
 
+def iter_daily_usage(data):
+    """Iterate over meter readings one day at a time.
+
+    Args:
+        data (pd.DataFrame or iterable of pd.DataFrame): Dataset of meter readings,
+            or chunks of it in timestamp order (e.g. from `get_meter_data_chunks`).
+
+    Yields:
+        tuple: Date and dataframe of that day's readings, with households as rows
+            and a column for each half hour.
+    """
+    if isinstance(data, pd.DataFrame):
+        data = [data]
+
+    leftover = None
+    for chunk in data:
+        if leftover is not None:
+            chunk = pd.concat([leftover, chunk])
+        dates = chunk["tstp"].dt.date
+
+        # The last day in a chunk may continue into the next one, so hold it back
+        complete = dates != dates.iloc[-1]
+        for date, day in chunk[complete].groupby(dates[complete]):
+            yield date, _day_matrix(day)
+        leftover = chunk[~complete]
+
+    if leftover is not None and len(leftover) > 0:
+        yield leftover["tstp"].dt.date.iloc[0], _day_matrix(leftover)
+
+
+def _day_matrix(day):
+    """Reshape one day of readings to households x half hours."""
+    day = day.set_index("time").select_dtypes("number")
+    day = day[~day.index.duplicated()]
+
+    return day.reindex(half_hours).T
+
+
+def get_usage_profiles(data, quantiles=(0.5, 0.9, 0.95), peak_day=True):
+    """For each household, get quantiles of usage for each half-hour of the day,
+    and optionally the usage profile of the household's peak day.
+    All profiles are computed in a single pass over the days, using streaming
+    quantile sketches, so `data` can be an iterator of chunks that does not fit in
+    memory.
+
+    Args:
+        data (pd.DataFrame or iterable of pd.DataFrame): Dataset of meter readings,
+            or chunks of it in timestamp order (e.g. from `get_meter_data_chunks`).
+        quantiles (tuple, optional): Quantiles to estimate.
+            Defaults to (0.5, 0.9, 0.95).
+        peak_day (bool, optional): Whether to also return the profile of the complete
+            day with the highest total usage. Defaults to True.
+
+    Returns:
+        dict: Usage profiles keyed by "median", "p90", "p95" etc. and "peak_day".
+    """
+    households = None
+    for _, day in iter_daily_usage(data):
+        values = day.to_numpy(dtype=float)
+
+        if households is None:
+            households = day.index
+            sketches = {q: P2QuantileSketch(values.shape, q) for q in quantiles}
+            peak_totals = np.full(len(households), -np.inf)
+            peak_profiles = np.full(values.shape, np.nan)
+
+        for sketch in sketches.values():
+            sketch.update(values)
+
+        if peak_day:
+            # Days with a missing reading have a NaN total so never count as the peak
+            totals = values.sum(axis=1)
+            is_peak = totals > peak_totals
+            peak_totals[is_peak] = totals[is_peak]
+            peak_profiles[is_peak] = values[is_peak]
+
+    if households is None:
+        raise ValueError("No meter readings found.")
+
+    profiles = {_quantile_name(q): sketch.result() for q, sketch in sketches.items()}
+    if peak_day:
+        profiles["peak_day"] = peak_profiles
+
+    return {
+        name: pd.DataFrame(values, index=households, columns=half_hours).dropna(axis=0)
+        for name, values in profiles.items()
+    }
+
+
+def _quantile_name(quantile):
+    """Name of a quantile profile, e.g. "median" or "p90"."""
+    return "median" if quantile == 0.5 else f"p{quantile * 100:g}"
+
+
+def get_quantile_usage(data, quantile=0.5):
+    """For each household, get a quantile of usage for each half-hour of the day.
+
+    Args:
+        data (pd.DataFrame or iterable of pd.DataFrame): Dataset of meter readings,
+            or chunks of it in timestamp order.
+        quantile (float, optional): Quantile to estimate. Defaults to 0.5 (median).
+
+    Returns:
+        pd.DataFrame: Quantile usage data.
+    """
+    return get_usage_profiles(data, quantiles=(quantile,), peak_day=False)[
+        _quantile_name(quantile)
+    ]
+
+
+def get_peak_day_usage(data):
+    """For each household, get the half-hourly usage on its highest-usage complete day.
+
+    Args:
+        data (pd.DataFrame or iterable of pd.DataFrame): Dataset of meter readings,
+            or chunks of it in timestamp order.
+
+    Returns:
+        pd.DataFrame: Peak day usage data.
+    """
+    return get_usage_profiles(data, quantiles=())["peak_day"]
+
+
 def get_average_usage_daytypes(data, normalise=False):
     """For each household, get average usage split by "day type" (weekday or weekend).
 
@@ -49,6 +179,8 @@ def get_average_usage_daytypes(data, normalise=False):
         pd.DataFrame: Average usage data split by day type.
     """
 
+    import holidays
+
     data = data.copy()
 
     data["day_of_week"] = data["tstp"].dt.day_of_week
@@ -165,10 +297,19 @@ def merge_household_data(usage_data):
     Returns:
         pd.DataFrame: Merged household usage and contextual data.
     """
-    household_data = get_household_data()
+    household_metadata = get_household_metadata()
 
-    merged_data = usage_data.reset_index().merge(
-        household_data, left_on="index", right_on="LCLid"
-    )[["index", "cluster", "stdorToU", "Acorn_grouped"]]
+    # Look up each household's row in the metadata; households without metadata
+    # are dropped
+    positions = household_metadata.index.get_indexer(usage_data.index)
+    found = positions >= 0
+
+    merged_data = (
+        household_metadata[["stdorToU", "Acorn_grouped"]]
+        .iloc[positions[found]]
+        .reset_index(drop=True)
+    )
+    merged_data.insert(0, "cluster", usage_data["cluster"].to_numpy()[found])
+    merged_data.insert(0, "index", usage_data.index[found])
 
     return merged_data
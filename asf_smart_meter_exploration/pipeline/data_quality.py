@@ -0,0 +1,224 @@
+# File: asf_smart_meter_exploration/pipeline/data_quality.py
+"""
+Data quality checks and gap filling for half-hourly readings, used when the raw
+data is processed (see `pipeline/process_raw_data.py`).
+
+For each household the QA report records null readings, duplicate and off-grid
+(not on the hour or half hour) timestamps in the raw data, and, on the matrix of
+readings, completeness between the first and last reading, outlying readings and
+the number of missing readings filled in. Short gaps are filled by interpolating
+between neighbouring readings, either in time ("linear") or between the same half
+hour on neighbouring days ("same_slot"), so that a few missing readings do not
+cause a household to be dropped by the aggregations in
+`pipeline/data_aggregation.py`. The report and the filling are done together in one
+pass over blocks of households.
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration import base_config
+
+gap_fill_method = base_config["gap_fill_method"]
+gap_fill_max_gap = base_config["gap_fill_max_gap"]
+outlier_threshold_mads = base_config["outlier_threshold_mads"]
+outlier_max_kwh = base_config["outlier_max_kwh"]
+
+gap_fill_methods = ["none", "linear", "same_slot"]
+# Households are checked and filled in blocks of columns to bound memory use
+qa_block_size = 512
+
+
+def clean_readings(readings):
+    """Drop null readings and readings with off-grid timestamps from raw readings,
+    counting both for each household. Duplicate readings are counted but kept.
+
+    Args:
+        readings (pd.DataFrame): Raw readings with "LCLid", "tstp" (datetime) and
+            "energy(kWh/hh)" (float) columns.
+
+    Returns:
+        tuple: Cleaned readings (pd.DataFrame) and counts for each household
+            (pd.DataFrame with "n_raw", "n_null", "n_duplicate" and "n_off_grid"
+            columns).
+    """
+    lclids = readings["LCLid"].astype("category")
+    codes = lclids.cat.codes.to_numpy()
+    n_households = len(lclids.cat.categories)
+
+    tstps = readings["tstp"]
+    null = readings["energy(kWh/hh)"].isna().to_numpy()
+    off_grid = ((tstps.dt.minute % 30 != 0) | (tstps.dt.second != 0)).to_numpy()
+    duplicate = readings.duplicated(["LCLid", "tstp"]).to_numpy() & ~null
+
+    counts = pd.DataFrame(
+        {
+            "n_raw": np.bincount(codes, minlength=n_households),
+            "n_null": np.bincount(codes, weights=null, minlength=n_households),
+            "n_duplicate": np.bincount(
+                codes, weights=duplicate, minlength=n_households
+            ),
+            "n_off_grid": np.bincount(
+                codes, weights=off_grid & ~null, minlength=n_households
+            ),
+        },
+        index=pd.Index(lclids.cat.categories.astype(str), name="LCLid"),
+    ).astype(int)
+
+    return readings[~null & ~off_grid], counts
+
+
+def complete_grid(wide):
+    """Reindex wide readings onto a complete half-hourly grid of whole days.
+
+    Args:
+        wide (pd.DataFrame): Readings with a timestamp index and a column per household.
+
+    Returns:
+        pd.DataFrame: Readings with a row for every half hour of every day covered.
+    """
+    start = wide.index.min().normalize()
+    end = wide.index.max().normalize() + pd.Timedelta(hours=23, minutes=30)
+
+    return wide.reindex(pd.date_range(start, end, freq="30min", name=wide.index.name))
+
+
+def interpolate_gaps(values, max_gap):
+    """Fill runs of at most `max_gap` missing values along the first axis, in place,
+    by linear interpolation between the valid values either side. Values before the
+    first or after the last valid value of a column are not filled.
+
+    Args:
+        values (np.ndarray): 2D float array.
+        max_gap (int): Longest run of missing values to fill.
+
+    Returns:
+        np.ndarray: Number of values filled in each column.
+    """
+    n_rows = len(values)
+    row = np.arange(n_rows)[:, None]
+    valid = ~np.isnan(values)
+
+    previous = np.maximum.accumulate(np.where(valid, row, -1), axis=0)
+    following = np.minimum.accumulate(np.where(valid, row, n_rows)[::-1], axis=0)[::-1]
+    fill = (
+        ~valid
+        & (previous >= 0)
+        & (following < n_rows)
+        & (following - previous - 1 <= max_gap)
+    )
+
+    rows, columns = np.nonzero(fill)
+    before, after = previous[rows, columns], following[rows, columns]
+    weight = (rows - before) / (after - before)
+    values[rows, columns] = values[before, columns] + weight * (
+        values[after, columns] - values[before, columns]
+    )
+
+    return fill.sum(axis=0)
+
+
+def block_quality(values, tstps):
+    """Compute completeness and outlier counts for a block of households.
+
+    Readings are outliers if they are negative, above `outlier_max_kwh` or more
+    than `outlier_threshold_mads` median absolute deviations above the household's
+    median.
+
+    Args:
+        values (np.ndarray): Readings on a complete half-hourly grid, with a column
+            per household.
+        tstps (pd.DatetimeIndex): Timestamp of each row.
+
+    Returns:
+        dict: "first_reading", "last_reading", "n_readings", "completeness" and
+            "n_outliers", each with a value per household.
+    """
+    n_rows = len(values)
+    valid = ~np.isnan(values)
+    observed = valid.any(axis=0)
+
+    first = np.where(observed, valid.argmax(axis=0), 0)
+    last = np.where(observed, n_rows - 1 - valid[::-1].argmax(axis=0), -1)
+    n_readings = valid.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        # Households with no valid readings have NaN statistics
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(values, axis=0)
+        mad = np.nanmedian(np.abs(values - median), axis=0)
+        outlier = (
+            (values < 0)
+            | (values > outlier_max_kwh)
+            | ((mad > 0) & (values - median > outlier_threshold_mads * mad))
+        )
+        completeness = n_readings / (last - first + 1)
+
+    return {
+        "first_reading": tstps[first].where(observed),
+        "last_reading": tstps[last].where(observed),
+        "n_readings": n_readings,
+        "completeness": completeness,
+        "n_outliers": outlier.sum(axis=0),
+    }
+
+
+def check_and_fill_gaps(
+    wide, counts=None, method=gap_fill_method, max_gap=gap_fill_max_gap
+):
+    """Compute the QA report for each household and fill short gaps in wide
+    readings, in place. Both are done in one pass over blocks of households, and
+    the report describes the readings before filling.
+
+    Args:
+        wide (pd.DataFrame): Readings on a complete half-hourly grid (see
+            `complete_grid`), with a column per household.
+        counts (pd.DataFrame, optional): Raw data counts from `clean_readings`,
+            added to the report. Defaults to None.
+        method (str, optional): "none", "linear" (interpolate between neighbouring
+            half hours) or "same_slot" (interpolate between the same half hour on
+            neighbouring days). Defaults to `gap_fill_method` in base config.
+        max_gap (int, optional): Longest gap to fill, in half hours for "linear"
+            and days for "same_slot". Defaults to `gap_fill_max_gap` in base
+            config.
+
+    Returns:
+        pd.DataFrame: QA report indexed by household ID, including the number of
+            readings filled ("n_filled").
+    """
+    if method not in gap_fill_methods:
+        raise ValueError(method + " gap filling not implemented.")
+
+    n_rows = len(wide)
+    report = []
+
+    for start in range(0, wide.shape[1], qa_block_size):
+        block = slice(start, start + qa_block_size)
+        values = wide.iloc[:, block].to_numpy(dtype=float, copy=method != "none")
+        n_columns = values.shape[1]
+
+        block_report = block_quality(values, wide.index)
+
+        if method == "none":
+            block_report["n_filled"] = np.zeros(n_columns, dtype=np.int64)
+        else:
+            if method == "linear":
+                filled = interpolate_gaps(values, max_gap)
+            else:
+                # Rows become days and columns become (half hour, household) pairs
+                by_day = values.reshape(n_rows // 48, 48 * n_columns)
+                filled = (
+                    interpolate_gaps(by_day, max_gap).reshape(48, n_columns).sum(axis=0)
+                )
+            wide.iloc[:, block] = values
+            block_report["n_filled"] = filled
+
+        report.append(pd.DataFrame(block_report, index=wide.columns[block]))
+
+    report = pd.concat(report).rename_axis("LCLid")
+    if counts is not None:
+        report = report.join(counts)
+
+    return report
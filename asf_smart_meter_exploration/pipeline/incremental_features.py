@@ -0,0 +1,309 @@
+# File: asf_smart_meter_exploration/pipeline/incremental_features.py
+"""
+Running per-household usage sums that can be updated as new readings arrive
+and turned into the features of any mean-based clustering variant without
+revisiting earlier readings.
+
+Sums and counts are kept for each household, half-hour slot and "group", where a
+group is a combination of day type (weekday or weekend/bank holiday) and season.
+Every mean-based aggregation in `pipeline/data_aggregation.py` can be recovered
+from these, e.g. the average usage is the sum over all groups divided by the count.
+"""
+
+import numpy as np
+import pandas as pd
+
+n_slots = 48
+n_seasons = 4
+n_groups = 2 * n_seasons
+
+season_dict = {
+    "winter": 0,
+    "spring": 1,
+    "summer": 2,
+    "autumn": 3,
+}
+
+
+class HouseholdProfileAccumulator:
+    """Per-household running sums and counts of half-hourly usage.
+
+    Args:
+        capacity (int, optional): Number of households to allocate space for
+            initially. Space grows as new households are seen. Defaults to 1024.
+    """
+
+    def __init__(self, capacity=1024):
+        self.households = {}
+        self.sums = np.zeros((capacity, n_groups, n_slots))
+        self.counts = np.zeros((capacity, n_groups, n_slots), dtype=np.int32)
+        self._bank_holidays = {}
+
+    @property
+    def household_ids(self):
+        """pd.Index: IDs of the households seen so far, in row order."""
+        return pd.Index(list(self.households))
+
+    def rows(self, lclids, add_missing=False):
+        """Row of each household in the sum and count arrays.
+
+        Args:
+            lclids (array-like): Household IDs.
+            add_missing (bool, optional): Whether to allocate rows for unseen
+                households. Otherwise their row is -1. Defaults to False.
+
+        Returns:
+            np.ndarray: Row of each household (-1 for null IDs).
+
+        Raises:
+            ValueError: if `add_missing` is set and any ID is null.
+        """
+        # Readings repeat the same few households, so only look up each one once.
+        # Null IDs get code -1
+        codes, unique_lclids = pd.factorize(np.asarray(lclids, dtype=object))
+        if add_missing and (codes < 0).any():
+            raise ValueError("Household IDs must not be null.")
+
+        unique_rows = np.fromiter(
+            (self.households.get(lclid, -1) for lclid in unique_lclids),
+            dtype=np.int64,
+            count=len(unique_lclids),
+        )
+        if add_missing and (unique_rows < 0).any():
+            for i in np.flatnonzero(unique_rows < 0):
+                unique_rows[i] = self.households.setdefault(
+                    unique_lclids[i], len(self.households)
+                )
+            self._grow(len(self.households))
+
+        rows = np.full(len(codes), -1, dtype=np.int64)
+        rows[codes >= 0] = unique_rows[codes[codes >= 0]]
+
+        return rows
+
+    def _grow(self, n_households):
+        """Make sure there is space for `n_households` rows."""
+        capacity = len(self.sums)
+        if n_households <= capacity:
+            return
+        while capacity < n_households:
+            capacity *= 2
+
+        extra = capacity - len(self.sums)
+        self.sums = np.concatenate(
+            [self.sums, np.zeros((extra, n_groups, n_slots), dtype=self.sums.dtype)]
+        )
+        self.counts = np.concatenate(
+            [self.counts, np.zeros((extra, n_groups, n_slots), dtype=self.counts.dtype)]
+        )
+
+    def groups(self, tstps):
+        """Group (day type and season) of each timestamp.
+
+        Args:
+            tstps (pd.DatetimeIndex): Reading timestamps.
+
+        Returns:
+            np.ndarray: Group of each timestamp.
+        """
+        weekend = np.asarray(tstps.dayofweek >= 5)
+        weekend |= np.isin(np.asarray(tstps.normalize()), self._holidays(tstps))
+        season = np.asarray(tstps.month // 3 % 4)
+
+        return weekend * n_seasons + season
+
+    def _holidays(self, tstps):
+        """Bank holiday dates covering the years of `tstps`, cached by year."""
+        import holidays
+
+        for year in np.unique(tstps.year):
+            if year not in self._bank_holidays:
+                self._bank_holidays[year] = pd.to_datetime(
+                    list(
+                        holidays.country_holidays(
+                            "UK", subdiv="England", years=[int(year)]
+                        ).keys()
+                    )
+                )
+        return np.concatenate(
+            [
+                np.asarray(dates, dtype="datetime64[ns]")
+                for dates in self._bank_holidays.values()
+            ]
+        )
+
+    def add_readings(self, lclids, tstps, values, sign=1):
+        """Add half-hourly readings. Missing (NaN) readings are ignored.
+
+        Args:
+            lclids (array-like): Household ID of each reading.
+            tstps (array-like): Timestamp of each reading.
+            values (array-like): Usage (kWh) of each reading.
+            sign (int, optional): 1 to add the readings, or -1 to remove readings
+                that were added before (e.g. to replace them with corrected ones).
+                Defaults to 1.
+
+        Returns:
+            np.ndarray: Rows of the households that had readings.
+        """
+        lclids = np.asarray(lclids, dtype=object)
+        tstps = pd.DatetimeIndex(tstps)
+        values = np.asarray(values, dtype=float)
+
+        valid = ~np.isnan(values)
+        lclids, tstps, values = lclids[valid], tstps[valid], values[valid]
+        if len(values) == 0:
+            return np.array([], dtype=np.int64)
+
+        rows = self.rows(lclids, add_missing=True)
+        # Many readings share a timestamp, so find groups and slots once per timestamp
+        codes, unique_tstps = pd.factorize(tstps)
+        groups = self.groups(unique_tstps)[codes]
+        slots = np.asarray(unique_tstps.hour * 2 + unique_tstps.minute // 30)[codes]
+
+        # Flat positions in the (household, group, slot) arrays. Readings are
+        # summed over the positions they touch with bincount, which is much
+        # faster than `np.add.at` for many readings and does not depend on the
+        # number of households
+        positions = (rows * n_groups + groups) * n_slots + slots
+        touched, inverse = np.unique(positions, return_inverse=True)
+        self.sums.reshape(-1)[touched] += sign * np.bincount(inverse, weights=values)
+        self.counts.reshape(-1)[touched] += sign * np.bincount(inverse).astype(
+            self.counts.dtype
+        )
+
+        return np.unique(rows)
+
+    def add_meter_data(self, data, sign=1):
+        """Add readings in the wide format produced by `get_meter_data`
+        (a row per timestamp and a column per household).
+
+        Args:
+            data (pd.DataFrame): Smart meter data or a chunk of it.
+            sign (int, optional): 1 to add the readings, or -1 to remove them
+                (see `add_readings`). Defaults to 1.
+
+        Returns:
+            np.ndarray: Rows of the households that had readings.
+        """
+        readings = data.set_index("tstp").select_dtypes("number")
+        values = readings.to_numpy(dtype=float)
+
+        return self.add_readings(
+            np.tile(readings.columns.to_numpy(dtype=object), len(readings)),
+            readings.index.repeat(readings.shape[1]),
+            values.reshape(-1),
+            sign=sign,
+        )
+
+    def add_sums(self, lclids, sums, counts):
+        """Add sums and counts computed elsewhere, e.g. by another accumulator
+        over a different set of readings.
+
+        Args:
+            lclids (array-like): Household IDs (unique).
+            sums (np.ndarray): Usage sums for each household, group and half hour.
+            counts (np.ndarray): Reading counts for each household, group and half hour.
+
+        Returns:
+            np.ndarray: Rows of the households.
+        """
+        rows = self.rows(np.asarray(lclids, dtype=object), add_missing=True)
+        self.sums[rows] += sums
+        self.counts[rows] += counts
+
+        return rows
+
+    def mean_usage(self, rows, groups=None):
+        """Mean usage in each half hour over the given groups.
+
+        Args:
+            rows (np.ndarray): Household rows.
+            groups (list, optional): Groups to include. Defaults to all groups.
+
+        Returns:
+            np.ndarray: Mean usage with a row per household and a column per half hour.
+                NaN where a household has no readings for a half hour.
+        """
+        if groups is None:
+            groups = slice(None)
+        sums = self.sums[rows][:, groups].sum(axis=1)
+        counts = self.counts[rows][:, groups].sum(axis=1)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+
+    def features(self, recipe, rows):
+        """Features of a clustering variant for the given households, matching
+        the output of the variant's aggregation function in
+        `pipeline/data_aggregation.py`.
+
+        Args:
+            recipe (dict): "aggregation" (function name) and "aggregation_kwargs"
+                of the variant, as in `config/plot_variants.py`.
+            rows (np.ndarray): Household rows.
+
+        Returns:
+            np.ndarray: Features with a row per household and a column per half hour.
+                Rows with any NaN could not be computed from the readings so far.
+        """
+        aggregation = recipe["aggregation"]
+        kwargs = recipe.get("aggregation_kwargs", {})
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            if aggregation == "get_average_usage":
+                features = self.mean_usage(rows)
+                if kwargs.get("normalised", False):
+                    features = features / features.sum(axis=1, keepdims=True)
+                if kwargs.get("cumulative", False):
+                    features = features.cumsum(axis=1)
+
+            elif aggregation == "get_daytype_diff":
+                weekday = self.mean_usage(rows, list(range(n_seasons)))
+                weekend = self.mean_usage(rows, list(range(n_seasons, n_groups)))
+                if kwargs.get("type", "diff") == "diff":
+                    features = weekend - weekday
+                else:
+                    features = weekend / weekday
+                    features[np.isinf(features)] = np.nan
+
+            elif aggregation == "get_season_diff":
+                season_means = [
+                    self.mean_usage(rows, [season, season + n_seasons])
+                    for season in range(n_seasons)
+                ]
+                season_1 = season_means[season_dict[kwargs.get("season_1", "winter")]]
+                season_2 = kwargs.get("season_2", "summer")
+                if season_2 == "spring and autumn":
+                    features = season_1 - (season_means[1] + season_means[3]) / 2
+                else:
+                    features = season_1 - season_means[season_dict[season_2]]
+
+            else:
+                raise ValueError(
+                    aggregation + " variants cannot be built from running sums."
+                )
+
+        return features
+
+
+def variant_recipe(spec):
+    """Serialisable description of how a variant's features are built.
+
+    Args:
+        spec (dict): Entry of `variant_specs` in `config/plot_variants.py`.
+
+    Returns:
+        dict: "aggregation" (function name or usage profile),
+            "aggregation_kwargs" and "k".
+    """
+    if "profile" in spec:
+        aggregation = "profile:" + spec["profile"]
+    else:
+        aggregation = spec["aggregation"].__name__
+
+    return {
+        "aggregation": aggregation,
+        "aggregation_kwargs": spec.get("aggregation_kwargs", {}),
+        "k": spec["k"],
+    }
@@ -0,0 +1,560 @@
+# File: asf_smart_meter_exploration/pipeline/online_clustering.py
+"""
+Script to keep a variant's clusters up to date as new readings arrive, rather than
+re-clustering from scratch.
+
+Running per-household usage sums (see `pipeline/incremental_features.py`) are kept
+along with each household's current features and cluster, and the sum and count of
+the features of each cluster's members. When new readings arrive, only the households
+they belong to have their features rebuilt: each is removed from its cluster's sums,
+assigned to the nearest centroid and added to that cluster's sums, and the centroids
+of the affected clusters are moved to the mean of their members (a sequential k-means
+update over the batch). Households whose readings did not change keep their cluster.
+
+Because unchanged households are not reassigned, the clusters can drift from a fresh
+k-means fit. Drift is measured as the relative increase in the mean squared distance
+of households from their centroid over its lowest value since the last full fit (the
+distance falls as households' features settle with more readings); once it exceeds
+`online_drift_threshold`, k-means is refitted on all households' current features.
+
+State is saved between runs, along with how far the merged meter data file has been
+read, so a daily refresh only reads the rows added since the last refresh
+(`python asf_smart_meter_exploration/pipeline/online_clustering.py` or
+`smartmeter refresh`). The last `online_refresh_overlap_days` days are read again each
+time, replacing the readings added before, as gap filling can change them once later
+readings arrive. If the file's households or the data quality settings change, all
+readings are added again.
+"""
+
+import io
+import itertools
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration import PROJECT_DIR, base_config
+from asf_smart_meter_exploration.pipeline.data_aggregation import half_hours
+from asf_smart_meter_exploration.pipeline.incremental_features import (
+    HouseholdProfileAccumulator,
+    variant_recipe,
+)
+from asf_smart_meter_exploration.utils.clustering_utils import (
+    fit_clustering,
+    nearest_centroids,
+)
+
+meter_data_merged_file_path = PROJECT_DIR / base_config["meter_data_merged_file_path"]
+meter_data_chunksize = base_config["meter_data_chunksize"]
+online_clusters_folder_path = PROJECT_DIR / base_config["online_clusters_folder_path"]
+online_drift_threshold = base_config["online_drift_threshold"]
+online_refresh_overlap_days = base_config["online_refresh_overlap_days"]
+
+
+def iter_meter_data_rows(file_path, offset=0, chunksize=meter_data_chunksize):
+    """Read the merged meter data CSV in chunks of rows, starting from a byte offset,
+    keeping track of where each row starts in the file.
+
+    Args:
+        file_path (str or Path): Path of the merged meter data CSV.
+        offset (int, optional): Byte offset of the first row to read. Defaults to 0
+            (the first row after the header).
+        chunksize (int, optional): Number of timestamps (rows) per chunk.
+            Defaults to `meter_data_chunksize` in base config.
+
+    Yields:
+        tuple: Chunk of smart meter data with a "tstp" column and a column per
+            household, and the byte offset of each of its rows.
+    """
+    with open(file_path, "rb") as f:
+        header = f.readline()
+        position = max(offset, f.tell())
+        f.seek(position)
+
+        while True:
+            lines = list(itertools.islice(f, chunksize))
+            if not lines:
+                break
+
+            ends = position + np.cumsum([len(line) for line in lines])
+            offsets = np.concatenate([[position], ends[:-1]])
+            position = ends[-1]
+
+            chunk = pd.read_csv(io.BytesIO(header + b"".join(lines)))
+            chunk["tstp"] = pd.to_datetime(chunk["tstp"])
+            yield chunk, offsets
+
+
+class OnlineClusterer:
+    """Clusters of one variant, updated as new readings arrive.
+
+    Args:
+        recipe (dict): Feature recipe of the variant (see
+            `pipeline/incremental_features.py`).
+        centroids (np.ndarray, optional): Initial centroids, e.g. from a saved cluster
+            model. Defaults to None (fit k-means with `recipe["k"]` clusters on the
+            first update).
+        accumulator (HouseholdProfileAccumulator, optional): Running sums to start from.
+            Defaults to an empty accumulator.
+        drift_threshold (float, optional): Drift above which k-means is refitted.
+            Defaults to `online_drift_threshold` in base config.
+        overlap_days (float, optional): Days before the last reading that are read
+            again by each `refresh`. Defaults to `online_refresh_overlap_days` in
+            base config.
+    """
+
+    def __init__(
+        self,
+        recipe,
+        centroids=None,
+        accumulator=None,
+        drift_threshold=online_drift_threshold,
+        overlap_days=online_refresh_overlap_days,
+    ):
+        self.recipe = recipe
+        self.accumulator = accumulator or HouseholdProfileAccumulator()
+        self.drift_threshold = drift_threshold
+        self.overlap = pd.Timedelta(days=overlap_days)
+        self.last_reading = None
+
+        # Where `refresh` got to in the merged meter data file: its header and the
+        # data quality settings it was produced with, the offset of the first row
+        # to read again, and the readings from that row on that have been added
+        self.source_header = None
+        self.source_params = None
+        self.source_offset = 0
+        self.window = None
+
+        self.centroids = None
+        self.cluster_sums = None
+        self.cluster_counts = None
+        self.baseline_inertia = np.nan
+        self.labels = np.full(0, -1, dtype=np.int64)
+        self.features = None
+
+        if centroids is not None:
+            self.centroids = np.array(centroids, dtype=float)
+            self._reset_statistics()
+
+    def _reset_statistics(self):
+        """Assign every household to its nearest centroid and recompute the
+        cluster sums."""
+        rows = np.arange(len(self.accumulator.households))
+        self.features = self.accumulator.features(self.recipe, rows)
+        self.labels = np.full(len(rows), -1, dtype=np.int64)
+
+        complete = ~np.isnan(self.features).any(axis=1)
+        if complete.any():
+            self.labels[complete], _ = nearest_centroids(
+                self.features[complete], self.centroids
+            )
+
+        k, n_features = self.centroids.shape
+        self.cluster_sums = np.zeros((k, n_features))
+        self.cluster_counts = np.zeros(k, dtype=np.int64)
+        np.add.at(self.cluster_sums, self.labels[complete], self.features[complete])
+        np.add.at(self.cluster_counts, self.labels[complete], 1)
+
+        self.baseline_inertia = self.inertia()
+
+    def fit(self):
+        """Refit k-means on the current features of all households.
+
+        Returns:
+            bool: Whether k-means was fitted (there must be at least k households
+                with complete features).
+        """
+        rows = np.arange(len(self.accumulator.households))
+        features = self.accumulator.features(self.recipe, rows)
+        complete = ~np.isnan(features).any(axis=1)
+        if complete.sum() < self.recipe["k"]:
+            return False
+
+        self.centroids = fit_clustering(
+            features[complete], self.recipe["k"]
+        ).cluster_centers_
+        self._reset_statistics()
+
+        return True
+
+    def inertia(self):
+        """Mean squared distance of households from their cluster centroid.
+
+        Returns:
+            float: Mean squared distance (NaN if no households are assigned).
+        """
+        assigned = self.labels >= 0
+        if not assigned.any():
+            return np.nan
+
+        return (
+            ((self.features[assigned] - self.centroids[self.labels[assigned]]) ** 2)
+            .sum(axis=1)
+            .mean()
+        )
+
+    def drift(self):
+        """Relative increase in inertia over its lowest value since the last full fit.
+
+        Returns:
+            float: Drift (0 if the clusters fit as well as they have since the last
+                refit, NaN before any fit).
+        """
+        return float(self.inertia() / self.baseline_inertia - 1)
+
+    def update(self, rows):
+        """Rebuild the features of households with new readings and update the
+        clusters, refitting if the drift exceeds the threshold.
+
+        Args:
+            rows (np.ndarray): Accumulator rows of households with new readings.
+
+        Returns:
+            dict: Number of households "updated", the "drift" after updating and
+                whether the clusters were "refit".
+        """
+        rows = np.unique(rows)
+        if self.centroids is None:
+            refit = self.fit()
+            return {"updated": len(rows), "drift": self.drift(), "refit": refit}
+
+        # Households seen for the first time have no features or cluster yet
+        n_households = len(self.accumulator.households)
+        n_new = n_households - len(self.labels)
+        if n_new > 0:
+            self.labels = np.concatenate(
+                [self.labels, np.full(n_new, -1, dtype=np.int64)]
+            )
+            self.features = np.concatenate(
+                [self.features, np.full((n_new, self.centroids.shape[1]), np.nan)]
+            )
+
+        old_labels = self.labels[rows]
+        had_cluster = old_labels >= 0
+        np.subtract.at(
+            self.cluster_sums, old_labels[had_cluster], self.features[rows[had_cluster]]
+        )
+        np.subtract.at(self.cluster_counts, old_labels[had_cluster], 1)
+
+        features = self.accumulator.features(self.recipe, rows)
+        complete = ~np.isnan(features).any(axis=1)
+        labels = np.full(len(rows), -1, dtype=np.int64)
+        if complete.any():
+            labels[complete], _ = nearest_centroids(features[complete], self.centroids)
+        np.add.at(self.cluster_sums, labels[complete], features[complete])
+        np.add.at(self.cluster_counts, labels[complete], 1)
+
+        self.features[rows] = features
+        self.labels[rows] = labels
+
+        # Move each affected cluster's centroid to the mean of its current members
+        affected = np.unique(np.concatenate([old_labels, labels]))
+        affected = affected[(affected >= 0) & (self.cluster_counts[affected] > 0)]
+        self.centroids[affected] = (
+            self.cluster_sums[affected] / self.cluster_counts[affected, None]
+        )
+
+        # Features settle as households accumulate readings, which lowers the
+        # inertia, so drift is measured from the lowest inertia since the last fit.
+        # The baseline is also unset if centroids were given before any households
+        inertia = self.inertia()
+        if np.isnan(self.baseline_inertia) or inertia < self.baseline_inertia:
+            self.baseline_inertia = inertia
+
+        drift = self.drift()
+        refit = drift > self.drift_threshold
+        if refit:
+            refit = self.fit()
+
+        return {"updated": len(rows), "drift": drift, "refit": refit}
+
+    def add_meter_data(self, data):
+        """Add readings in the wide format produced by `get_meter_data` and update
+        the clusters. Readings at or before the last reading already added are ignored.
+
+        Args:
+            data (pd.DataFrame or iterable of pd.DataFrame): Smart meter data, or chunks
+                of it in timestamp order (e.g. from `get_meter_data_chunks`).
+
+        Returns:
+            dict: Summary of the update (see `update`).
+        """
+        if isinstance(data, pd.DataFrame):
+            data = [data]
+
+        rows = []
+        for chunk in data:
+            if self.last_reading is not None:
+                chunk = chunk[chunk["tstp"] > self.last_reading]
+            if len(chunk) == 0:
+                continue
+            rows.append(self.accumulator.add_meter_data(chunk))
+            self.last_reading = chunk["tstp"].max()
+
+        if not rows:
+            return {"updated": 0, "drift": self.drift(), "refit": False}
+
+        return self.update(np.concatenate(rows))
+
+    def refresh(self, file_path=meter_data_merged_file_path, rebuild=False):
+        """Add the readings in the merged meter data file that are new since the last
+        refresh and update the clusters. Only rows from the start of the overlap
+        window onwards are read; readings added from these rows before are removed
+        first, so corrections to them (e.g. gaps filled once later readings arrived)
+        are picked up.
+
+        All readings are added again, keeping the current centroids, if the file's
+        households or the data quality settings have changed, or if `rebuild` is set
+        (e.g. after earlier readings were corrected in other ways).
+
+        Args:
+            file_path (str or Path, optional): Path of the merged meter data CSV.
+                Defaults to `meter_data_merged_file_path` in base config.
+            rebuild (bool, optional): Whether to add all readings again.
+                Defaults to False.
+
+        Returns:
+            dict: Summary of the update (see `update`), with whether all readings
+                were "rebuilt".
+        """
+        from asf_smart_meter_exploration.pipeline.stages import (
+            quality_parameter_keys,
+        )
+
+        with open(file_path, "rb") as f:
+            header = f.readline().decode()
+        params = json.dumps([base_config[key] for key in quality_parameter_keys])
+
+        rebuild = rebuild or not self._can_resume(file_path, header, params)
+        if rebuild:
+            self.accumulator = HouseholdProfileAccumulator()
+            self.source_offset, self.window = 0, None
+        elif self.window is not None:
+            self.accumulator.add_meter_data(self.window, sign=-1)
+
+        rows, tail, tail_offsets = [], None, np.array([], dtype=np.int64)
+        for chunk, offsets in iter_meter_data_rows(file_path, self.source_offset):
+            rows.append(self.accumulator.add_meter_data(chunk))
+
+            # Keep the rows in the overlap window before the latest reading so far
+            tail = chunk if tail is None else pd.concat([tail, chunk])
+            tail_offsets = np.concatenate([tail_offsets, offsets])
+            keep = (tail["tstp"] > chunk["tstp"].max() - self.overlap).to_numpy()
+            tail, tail_offsets = tail[keep], tail_offsets[keep]
+
+        self.source_header, self.source_params = header, params
+        if tail is not None and len(tail) > 0:
+            self.window = tail.reset_index(drop=True)
+            self.source_offset = int(tail_offsets[0])
+            self.last_reading = tail["tstp"].max()
+
+        if rebuild and self.centroids is not None:
+            # Households may be in a different order, so reassign all of them
+            self._reset_statistics()
+            n_households = len(self.accumulator.households)
+            summary = {"updated": n_households, "drift": self.drift(), "refit": False}
+        elif rows:
+            summary = self.update(np.concatenate(rows))
+        else:
+            summary = {"updated": 0, "drift": self.drift(), "refit": False}
+
+        return {**summary, "rebuilt": rebuild}
+
+    def assignments(self):
+        """Current cluster of each household with complete features.
+
+        Returns:
+            pd.DataFrame: "cluster" and "distance" to the cluster centroid,
+                indexed by LCLid.
+        """
+        assigned = self.labels >= 0
+        distances = np.linalg.norm(
+            self.features[assigned] - self.centroids[self.labels[assigned]], axis=1
+        )
+
+        return pd.DataFrame(
+            {"cluster": self.labels[assigned], "distance": distances},
+            index=pd.Index(self.accumulator.household_ids[assigned], name="LCLid"),
+        )
+
+    def _can_resume(self, file_path, header, params):
+        """Whether `refresh` can carry on reading the file from where it got to."""
+        if header != self.source_header or params != self.source_params:
+            return False
+        if self.window is None:
+            return True
+
+        # Rows before the offset should be unchanged, so the row at the offset
+        # should still be the first row of the window
+        with open(file_path, "rb") as f:
+            f.seek(self.source_offset)
+            first_field = f.readline().split(b",")[0].decode()
+        try:
+            return pd.Timestamp(first_field) == self.window["tstp"].iloc[0]
+        except ValueError:
+            return False
+
+    def save(self, file_path):
+        """Save the clusterer's state, including the running sums.
+
+        Args:
+            file_path (str or Path): Path of the .npz file.
+        """
+        n_households = len(self.accumulator.households)
+        fitted = self.centroids is not None
+        window = self.window if self.window is not None else pd.DataFrame({"tstp": []})
+        window_readings = window.set_index("tstp").select_dtypes("number")
+
+        np.savez(
+            file_path,
+            recipe=json.dumps(self.recipe),
+            households=np.array(self.accumulator.household_ids, dtype=str),
+            sums=self.accumulator.sums[:n_households],
+            counts=self.accumulator.counts[:n_households],
+            fitted=fitted,
+            centroids=self.centroids if fitted else np.empty((0, 0)),
+            cluster_sums=self.cluster_sums if fitted else np.empty((0, 0)),
+            cluster_counts=self.cluster_counts if fitted else np.empty(0),
+            labels=self.labels,
+            features=self.features if fitted else np.empty((0, 0)),
+            baseline_inertia=self.baseline_inertia,
+            last_reading=np.datetime64(self.last_reading, "ns"),
+            source_header=self.source_header or "",
+            source_params=self.source_params or "",
+            source_offset=self.source_offset,
+            window_tstps=window_readings.index.to_numpy(dtype="datetime64[ns]"),
+            window_households=np.array(window_readings.columns, dtype=str),
+            window_values=window_readings.to_numpy(dtype=float),
+        )
+
+    @classmethod
+    def load(
+        cls,
+        file_path,
+        drift_threshold=online_drift_threshold,
+        overlap_days=online_refresh_overlap_days,
+    ):
+        """Load a clusterer saved with `save`.
+
+        Args:
+            file_path (str or Path): Path of the .npz file.
+            drift_threshold (float, optional): Drift above which k-means is refitted.
+                Defaults to `online_drift_threshold` in base config.
+            overlap_days (float, optional): Days read again by each `refresh`.
+                Defaults to `online_refresh_overlap_days` in base config.
+
+        Returns:
+            OnlineClusterer: Clusterer.
+        """
+        state = np.load(file_path)
+
+        accumulator = HouseholdProfileAccumulator(capacity=max(len(state["sums"]), 1))
+        accumulator.add_sums(state["households"], state["sums"], state["counts"])
+
+        clusterer = cls(
+            json.loads(str(state["recipe"])),
+            accumulator=accumulator,
+            drift_threshold=drift_threshold,
+            overlap_days=overlap_days,
+        )
+        clusterer.labels = state["labels"]
+        clusterer.baseline_inertia = float(state["baseline_inertia"])
+        if state["fitted"]:
+            clusterer.centroids = state["centroids"]
+            clusterer.cluster_sums = state["cluster_sums"]
+            clusterer.cluster_counts = state["cluster_counts"]
+            clusterer.features = state["features"]
+
+        last_reading = state["last_reading"][()]
+        clusterer.last_reading = (
+            None if np.isnat(last_reading) else pd.Timestamp(last_reading)
+        )
+
+        clusterer.source_header = str(state["source_header"]) or None
+        clusterer.source_params = str(state["source_params"]) or None
+        clusterer.source_offset = int(state["source_offset"])
+        if len(state["window_tstps"]) > 0:
+            window = pd.DataFrame(
+                state["window_values"], columns=state["window_households"].tolist()
+            )
+            window.insert(0, "tstp", state["window_tstps"])
+            clusterer.window = window
+
+        return clusterer
+
+
+def refresh_online_clusters(variant, rebuild=False, run_id=None):
+    """Update a variant's clusters with any readings added since the last refresh,
+    save the state and record the clusters in the results store (see
+    `pipeline/results_store.py`). On the first refresh, all readings are assigned
+    to the clusters saved by `smartmeter run cluster` (or k-means is fitted if
+    there are none).
+
+    Args:
+        variant (str): Name of variant.
+        rebuild (bool, optional): Whether to add all readings again (see
+            `OnlineClusterer.refresh`). Defaults to False.
+        run_id (str, optional): Run to record the results under.
+            Defaults to a new run.
+
+    Returns:
+        dict: Summary of the update (see `OnlineClusterer.refresh`).
+    """
+    from asf_smart_meter_exploration.config.plot_variants import variant_specs
+    from asf_smart_meter_exploration.getters.get_processed_data import (
+        get_variant_cluster_model,
+    )
+    from asf_smart_meter_exploration.pipeline.process_raw_data import (
+        produce_all_properties_df,
+    )
+    from asf_smart_meter_exploration.pipeline.results_store import (
+        ResultsStore,
+        new_run_id,
+    )
+
+    if not os.path.isfile(meter_data_merged_file_path):
+        produce_all_properties_df()
+    if not os.path.isdir(online_clusters_folder_path):
+        os.makedirs(online_clusters_folder_path)
+    state_file_path = online_clusters_folder_path / (variant + ".npz")
+
+    if os.path.isfile(state_file_path):
+        clusterer = OnlineClusterer.load(state_file_path)
+    else:
+        try:
+            recipe, centroids = get_variant_cluster_model(variant)
+            clusterer = OnlineClusterer(recipe, centroids.to_numpy())
+        except FileNotFoundError:
+            clusterer = OnlineClusterer(variant_recipe(variant_specs[variant]))
+
+    summary = clusterer.refresh(rebuild=rebuild)
+    clusterer.save(state_file_path)
+
+    if clusterer.centroids is not None:
+        assigned = clusterer.labels >= 0
+        ResultsStore().record_clustering(
+            run_id or new_run_id(),
+            variant,
+            pd.DataFrame(
+                clusterer.features[assigned],
+                index=clusterer.accumulator.household_ids[assigned],
+                columns=half_hours,
+            ),
+            clusterer.centroids,
+            {**clusterer.recipe, "mode": "online", "drift": summary["drift"]},
+            description="online refresh",
+        )
+
+    return summary
+
+
+if __name__ == "__main__":
+    from asf_smart_meter_exploration.config.plot_variants import variant_specs
+    from asf_smart_meter_exploration.pipeline.results_store import new_run_id
+
+    run_id = new_run_id()
+    for variant, spec in variant_specs.items():
+        if "profile" not in spec:
+            summary = refresh_online_clusters(variant, run_id=run_id)
+            print(f"Refreshing {variant}: {summary}")
@@ -5,12 +5,18 @@ Code adapted from https://www.kaggle.com/code/patrick0302/buildsys22-tutorial-0-
 """
 
 import pandas as pd
-import numpy as np
 import tqdm
 import os
 import zipfile
 
 from asf_smart_meter_exploration import base_config, PROJECT_DIR
+from asf_smart_meter_exploration.pipeline.data_quality import (
+    check_and_fill_gaps,
+    clean_readings,
+    complete_grid,
+    gap_fill_max_gap,
+    gap_fill_method,
+)
 
 meter_data_zip_path = PROJECT_DIR / base_config["meter_data_zip_path"]
 meter_data_folder_path = PROJECT_DIR / base_config["meter_data_folder_path"]
@@ -18,6 +24,7 @@ meter_data_merged_folder_path = (
     PROJECT_DIR / base_config["meter_data_merged_folder_path"]
 )
 meter_data_merged_file_path = PROJECT_DIR / base_config["meter_data_merged_file_path"]
+quality_report_file_path = PROJECT_DIR / base_config["quality_report_file_path"]
 
 
 def unzip_raw_data():
@@ -28,42 +35,105 @@ def unzip_raw_data():
         )
     else:
         with zipfile.ZipFile(meter_data_zip_path, "r") as zip_ref:
-            zip_ref.extractall("inputs")
+            zip_ref.extractall(meter_data_zip_path.parent)
         print("Unzipped!")
 
 
-def produce_all_properties_df():
-    """Process raw data (split into subfolders) and save as a single CSV file."""
-    if not os.path.isdir(meter_data_folder_path):
-        print("Unzipped folder not found. Unzipping...")
-        unzip_raw_data()
+def read_raw_block(file_path):
+    """Read one raw data file of half-hourly readings.
 
-    halfhourly_dataset = pd.DataFrame()
+    Args:
+        file_path (str): Path of the file.
 
-    print("Processing the data...")
-    folder_names = os.listdir(meter_data_folder_path)
-    for file_name in tqdm.tqdm(folder_names):
-        df_temp = pd.read_csv(
-            os.path.join(meter_data_folder_path, file_name),
-            index_col="tstp",
-            parse_dates=True,
-            low_memory=False,
-        )
-        df_temp["file_name"] = file_name.split(".")[0]
-        df_temp = df_temp.replace("Null", np.nan).dropna()
-        df_temp["energy(kWh/hh)"] = df_temp["energy(kWh/hh)"].astype("float")
-        halfhourly_dataset = pd.concat([halfhourly_dataset, df_temp])
+    Returns:
+        pd.DataFrame: Readings with "LCLid", "tstp" and "energy(kWh/hh)" columns.
+            Null readings are NaN.
+    """
+    readings = pd.read_csv(file_path, na_values="Null", low_memory=False)
+    readings.columns = readings.columns.str.strip()
+    readings["tstp"] = pd.to_datetime(readings["tstp"])
+    readings["energy(kWh/hh)"] = readings["energy(kWh/hh)"].astype("float")
+
+    return readings
+
+
+def process_raw_blocks(
+    file_paths, fill_method=gap_fill_method, max_gap=gap_fill_max_gap, progress=True
+):
+    """Process raw data files into a matrix of half-hourly readings and a data
+    quality report for each household (see `pipeline/data_quality.py`).
+
+    Args:
+        file_paths (list): Paths of raw data files.
+        fill_method (str, optional): How to fill short gaps in each household's
+            readings. Defaults to `gap_fill_method` in base config.
+        max_gap (int, optional): Longest gap to fill. Defaults to `gap_fill_max_gap`
+            in base config.
+        progress (bool, optional): Whether to show a progress bar. Defaults to True.
+
+    Returns:
+        tuple: Readings (pd.DataFrame indexed by timestamp, with a column per household)
+            and QA report (pd.DataFrame indexed by household ID).
+    """
+    blocks, block_counts = [], []
+    for file_path in tqdm.tqdm(file_paths, disable=not progress):
+        readings, counts = clean_readings(read_raw_block(file_path))
+        blocks.append(readings)
+        block_counts.append(counts)
+
+    halfhourly_dataset = pd.concat(blocks)
+    counts = pd.concat(block_counts).groupby(level="LCLid").sum()
 
     # Structure dataframe so that index is timestamps and columns are households (originally in the LCLid variable)
-    df_output = (
+    # Duplicate readings are averaged
+    df_output = complete_grid(
         halfhourly_dataset.groupby(["tstp", "LCLid"])["energy(kWh/hh)"]
         .mean(numeric_only=True)
         .unstack()
     )
+
+    report = check_and_fill_gaps(df_output, counts, fill_method, max_gap)
+
+    return df_output, report
+
+
+def raw_data_file_paths():
+    """Paths of the raw data files, unzipping the raw data first if needed.
+
+    Returns:
+        list: File paths.
+    """
+    if not os.path.isdir(meter_data_folder_path):
+        print("Unzipped folder not found. Unzipping...")
+        unzip_raw_data()
+
+    return [
+        os.path.join(meter_data_folder_path, file_name)
+        for file_name in os.listdir(meter_data_folder_path)
+    ]
+
+
+def produce_all_properties_df(fill_method=gap_fill_method, max_gap=gap_fill_max_gap):
+    """Process raw data (split into subfolders) and save as a single CSV file,
+    along with a data quality report for each household (see
+    `pipeline/data_quality.py`).
+
+    Args:
+        fill_method (str, optional): How to fill short gaps in each household's
+            readings. Defaults to `gap_fill_method` in base config.
+        max_gap (int, optional): Longest gap to fill. Defaults to `gap_fill_max_gap`
+            in base config.
+    """
+    file_paths = raw_data_file_paths()
+
+    print("Processing the data...")
+    df_output, report = process_raw_blocks(file_paths, fill_method, max_gap)
+
     if not os.path.isdir(meter_data_merged_folder_path):
         os.makedirs(meter_data_merged_folder_path)
 
     df_output.to_csv(meter_data_merged_file_path)
+    report.to_csv(quality_report_file_path)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,397 @@
+# File: asf_smart_meter_exploration/pipeline/results_store.py
+"""
+Embedded SQLite store of clustering results, so that questions such as "which cluster
+was household X in for variant Y in the last run" can be answered without rerunning.
+
+Each run (e.g. one `smartmeter run cluster` call) records, for every variant it
+clustered, the variant's configuration, the cluster centroids and sizes, and each
+household's cluster and distance to its centroid. Labels are keyed by
+(run, variant, LCLid) and also indexed by household, so lookups for a household
+and comparisons between runs (e.g. label transitions) use the indexes. Cluster
+numbers from separate fits are arbitrary, so clusters are matched by their
+centroids before labels are compared across runs.
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration import PROJECT_DIR, base_config
+from asf_smart_meter_exploration.utils.clustering_utils import nearest_centroids
+
+results_store_file_path = PROJECT_DIR / base_config["results_store_file_path"]
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    description TEXT
+);
+CREATE TABLE IF NOT EXISTS variants (
+    run_id TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    config TEXT NOT NULL,
+    k INTEGER NOT NULL,
+    inertia REAL,
+    PRIMARY KEY (run_id, variant)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS clusters (
+    run_id TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    cluster INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    centroid TEXT NOT NULL,
+    PRIMARY KEY (run_id, variant, cluster)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS labels (
+    run_id TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    LCLid TEXT NOT NULL,
+    cluster INTEGER NOT NULL,
+    distance REAL NOT NULL,
+    PRIMARY KEY (run_id, variant, LCLid)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS labels_by_household ON labels (LCLid, variant, run_id);
+"""
+
+
+def new_run_id():
+    """ID for a new run, based on the current time.
+
+    Returns:
+        str: Run ID.
+    """
+    return datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f")
+
+
+class ResultsStore:
+    """Reads and writes clustering results in a SQLite file.
+
+    Args:
+        file_path (str or Path, optional): Path of the database file, created if needed.
+            Defaults to `results_store_file_path` in base config.
+    """
+
+    def __init__(self, file_path=results_store_file_path):
+        self.file_path = file_path
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        with closing(self._connect()) as connection:
+            # Write-ahead logging lets parallel cluster stages record results
+            # concurrently
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(schema)
+
+    def _connect(self):
+        """Open a connection to the database."""
+        return sqlite3.connect(self.file_path, timeout=60)
+
+    def _query(self, sql, params=()):
+        """Run a query and return the result as a dataframe."""
+        with closing(self._connect()) as connection:
+            return pd.read_sql_query(sql, connection, params=params)
+
+    def record_clustering(
+        self, run_id, variant, data, centroids, config, inertia=None, description=""
+    ):
+        """Record a variant's clusters, assigning each household to its nearest
+        centroid. Replaces anything already recorded for the variant in the run.
+
+        Args:
+            run_id (str): Run ID (see `new_run_id`). The run is created if needed.
+            variant (str): Name of variant.
+            data (pd.DataFrame): Variant data, with households as rows.
+            centroids (np.ndarray): Cluster centroids.
+            config (dict): Variant configuration, e.g. its feature recipe
+                (see `pipeline/incremental_features.py`).
+            inertia (float, optional): Clustering inertia. Defaults to None.
+            description (str, optional): Description of the run, if it is new.
+                Defaults to "".
+
+        Returns:
+            np.ndarray: Cluster of each household.
+        """
+        centroids = np.asarray(centroids, dtype=float)
+        clusters, distances = nearest_centroids(data.to_numpy(dtype=float), centroids)
+        sizes = np.bincount(clusters, minlength=len(centroids))
+        config = {**config, "columns": [str(column) for column in data.columns]}
+
+        with closing(self._connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR IGNORE INTO runs VALUES (?, ?, ?)",
+                (run_id, datetime.datetime.now().isoformat(), description),
+            )
+            for table in ["variants", "clusters", "labels"]:
+                connection.execute(
+                    f"DELETE FROM {table} WHERE run_id = ? AND variant = ?",
+                    (run_id, variant),
+                )
+            connection.execute(
+                "INSERT INTO variants VALUES (?, ?, ?, ?, ?)",
+                (run_id, variant, json.dumps(config), len(centroids), inertia),
+            )
+            connection.executemany(
+                "INSERT INTO clusters VALUES (?, ?, ?, ?, ?)",
+                (
+                    (run_id, variant, cluster, int(size), json.dumps(centroid))
+                    for cluster, (size, centroid) in enumerate(
+                        zip(sizes, centroids.tolist())
+                    )
+                ),
+            )
+            connection.executemany(
+                "INSERT INTO labels VALUES (?, ?, ?, ?, ?)",
+                zip(
+                    [run_id] * len(data),
+                    [variant] * len(data),
+                    data.index.astype(str),
+                    clusters.tolist(),
+                    distances.tolist(),
+                ),
+            )
+
+        return clusters
+
+    def runs(self):
+        """All runs, with the variants recorded in each.
+
+        Returns:
+            pd.DataFrame: Runs indexed by run ID, oldest first.
+        """
+        return self._query("""
+            SELECT runs.run_id, created_at, description,
+                   GROUP_CONCAT(variant, ', ') AS variants
+            FROM runs LEFT JOIN variants ON variants.run_id = runs.run_id
+            GROUP BY runs.run_id
+            ORDER BY created_at
+            """).set_index("run_id")
+
+    def latest_run_id(self, variant):
+        """Most recent run that recorded a variant.
+
+        Args:
+            variant (str): Name of variant.
+
+        Returns:
+            str: Run ID.
+
+        Raises:
+            ValueError: if no run recorded the variant.
+        """
+        with closing(self._connect()) as connection:
+            row = connection.execute(
+                """
+                SELECT run_id FROM variants JOIN runs USING (run_id)
+                WHERE variant = ? ORDER BY created_at DESC LIMIT 1
+                """,
+                (variant,),
+            ).fetchone()
+        if row is None:
+            raise ValueError(f"No results recorded for {variant}.")
+
+        return row[0]
+
+    def variant_config(self, variant, run_id=None):
+        """Configuration a variant was clustered with.
+
+        Args:
+            variant (str): Name of variant.
+            run_id (str, optional): Run ID. Defaults to the latest run with
+                the variant.
+
+        Returns:
+            dict: Variant configuration, with "k" and "inertia" added.
+
+        Raises:
+            ValueError: if the run did not record the variant.
+        """
+        run_id = run_id or self.latest_run_id(variant)
+        rows = self._query(
+            "SELECT config, k, inertia FROM variants WHERE run_id = ? AND variant = ?",
+            (run_id, variant),
+        )
+        if rows.empty:
+            raise ValueError(f"No results recorded for {variant} in run {run_id}.")
+        row = rows.iloc[0]
+
+        return {
+            **json.loads(row["config"]),
+            "k": int(row["k"]),
+            "inertia": row["inertia"],
+        }
+
+    def labels(self, variant, run_id=None):
+        """Cluster and distance to the cluster centroid of each household.
+
+        Args:
+            variant (str): Name of variant.
+            run_id (str, optional): Run ID. Defaults to the latest run with
+                the variant.
+
+        Returns:
+            pd.DataFrame: "cluster" and "distance", indexed by LCLid.
+
+        Raises:
+            ValueError: if the run did not record the variant.
+        """
+        run_id = run_id or self.latest_run_id(variant)
+        labels = self._query(
+            """
+            SELECT LCLid, cluster, distance FROM labels
+            WHERE run_id = ? AND variant = ?
+            """,
+            (run_id, variant),
+        )
+        if labels.empty:
+            raise ValueError(f"No results recorded for {variant} in run {run_id}.")
+
+        return labels.set_index("LCLid")
+
+    def clusters(self, variant, run_id=None):
+        """Size and centroid of each cluster.
+
+        Args:
+            variant (str): Name of variant.
+            run_id (str, optional): Run ID. Defaults to the latest run with
+                the variant.
+
+        Returns:
+            pd.DataFrame: "size" and a column for each feature of the centroid,
+                indexed by cluster.
+        """
+        run_id = run_id or self.latest_run_id(variant)
+        columns = self.variant_config(variant, run_id)["columns"]
+        clusters = self._query(
+            """
+            SELECT cluster, size, centroid FROM clusters
+            WHERE run_id = ? AND variant = ? ORDER BY cluster
+            """,
+            (run_id, variant),
+        ).set_index("cluster")
+        centroids = pd.DataFrame(
+            clusters["centroid"].map(json.loads).tolist(),
+            index=clusters.index,
+            columns=columns,
+        )
+
+        return clusters[["size"]].join(centroids)
+
+    def household_history(self, lclid, variant=None):
+        """Cluster of a household in every run.
+
+        Args:
+            lclid (str): Household ID.
+            variant (str, optional): Name of variant. Defaults to all variants.
+
+        Returns:
+            pd.DataFrame: Run ID, run time, variant, cluster and distance, oldest first.
+        """
+        sql = """
+            SELECT labels.run_id, created_at, variant, cluster, distance
+            FROM labels JOIN runs ON runs.run_id = labels.run_id
+            WHERE LCLid = ?
+        """
+        params = (lclid,)
+        if variant is not None:
+            sql += " AND variant = ?"
+            params += (variant,)
+
+        return self._query(sql + " ORDER BY created_at, variant", params)
+
+    def match_clusters(self, variant, run_from, run_to):
+        """Match the clusters of one run to those of another by their centroids.
+        Cluster numbers from separate k-means fits are arbitrary, so the same
+        cluster can have a different number in each run.
+
+        Args:
+            variant (str): Name of variant.
+            run_from (str): Run ID whose cluster numbers are kept.
+            run_to (str): Run ID whose clusters are renumbered.
+
+        Returns:
+            dict: Number of the matching `run_from` cluster for each `run_to` cluster.
+                Clusters left unmatched (if `run_to` has more clusters) are numbered
+                after the `run_from` clusters.
+
+        Raises:
+            ValueError: if the runs clustered the variant on different features.
+        """
+        from scipy.optimize import linear_sum_assignment
+
+        centroids_from = self.clusters(variant, run_from).drop(columns="size")
+        centroids_to = self.clusters(variant, run_to).drop(columns="size")
+        if list(centroids_from.columns) != list(centroids_to.columns):
+            raise ValueError(
+                f"Runs {run_from} and {run_to} clustered {variant} "
+                "on different features."
+            )
+
+        # Pair clusters so that the total distance between paired centroids is smallest
+        distances = np.linalg.norm(
+            centroids_to.to_numpy()[:, None] - centroids_from.to_numpy()[None], axis=2
+        )
+        rows, columns = linear_sum_assignment(distances)
+        matches = dict(
+            zip(
+                centroids_to.index[rows].tolist(),
+                centroids_from.index[columns].tolist(),
+            )
+        )
+
+        unmatched = [
+            cluster for cluster in centroids_to.index if cluster not in matches
+        ]
+        for i, cluster in enumerate(unmatched):
+            matches[cluster] = len(centroids_from) + i
+
+        return matches
+
+    def label_transitions(self, variant, run_from, run_to, align=True):
+        """Number of households moving between each pair of clusters from one run to
+        another. Only households recorded in both runs are counted.
+
+        Args:
+            variant (str): Name of variant.
+            run_from (str): Earlier run ID.
+            run_to (str): Later run ID.
+            align (bool, optional): Whether to renumber the clusters of `run_to` to
+                match those of `run_from` (see `match_clusters`). Without this, the
+                counts only make sense if both runs share one fit, e.g. successive
+                online refreshes without a refit. Defaults to True.
+
+        Returns:
+            pd.DataFrame: Household counts, with clusters in `run_from` as rows and
+                clusters in `run_to` as columns.
+        """
+        transitions = self._query(
+            """
+            SELECT a.cluster AS cluster_from, b.cluster AS cluster_to,
+                   COUNT(*) AS households
+            FROM labels AS a
+            JOIN labels AS b
+                ON b.run_id = ? AND b.variant = a.variant AND b.LCLid = a.LCLid
+            WHERE a.run_id = ? AND a.variant = ?
+            GROUP BY a.cluster, b.cluster
+            """,
+            (run_to, run_from, variant),
+        )
+        if align:
+            transitions["cluster_to"] = transitions["cluster_to"].map(
+                self.match_clusters(variant, run_from, run_to)
+            )
+
+        return (
+            transitions.pivot_table(
+                index="cluster_from",
+                columns="cluster_to",
+                values="households",
+                aggfunc="sum",
+            )
+            .fillna(0)
+            .astype(int)
+        )
@@ -0,0 +1,224 @@
+# File: asf_smart_meter_exploration/pipeline/sharding.py
+"""
+Script to run ingest and aggregation split across shards of households.
+
+The raw data is already split into files (blocks) by household, so each shard is a
+set of raw files. Each shard worker processes its files into readings (including the
+data quality checks and gap filling in `pipeline/data_quality.py`) and reduces them to
+per-household sums and counts (see `pipeline/incremental_features.py`) and, if needed,
+usage profiles. Only these partial results are sent back; they are then combined
+into the dataframe to cluster for each variant, the same as `smartmeter run aggregate`
+would produce from the merged data.
+
+Sums and counts can be combined even if a household's readings are split across
+shards. Quantile and peak day profiles cannot, so these variants require every
+household's readings to be in one raw file (as in the LCL data).
+"""
+
+import numpy as np
+import pandas as pd
+
+from asf_smart_meter_exploration import base_config
+from asf_smart_meter_exploration.config.plot_variants import variant_specs
+from asf_smart_meter_exploration.pipeline.data_aggregation import (
+    get_usage_profiles,
+    half_hours,
+)
+from asf_smart_meter_exploration.pipeline.incremental_features import (
+    HouseholdProfileAccumulator,
+    variant_recipe,
+)
+from asf_smart_meter_exploration.pipeline.process_raw_data import (
+    process_raw_blocks,
+    raw_data_file_paths,
+)
+from asf_smart_meter_exploration.utils.shard_utils import get_backend, partition_files
+
+meter_data_chunksize = base_config["meter_data_chunksize"]
+shard_count = base_config["shard_count"]
+shard_backend = base_config["shard_backend"]
+shard_max_workers = base_config["shard_max_workers"]
+
+
+def process_shard(file_paths, profiles=False):
+    """Process one shard of raw files into partial aggregates.
+
+    Args:
+        file_paths (list): Raw data files in the shard.
+        profiles (bool, optional): Whether to also compute usage profiles
+            (see `get_usage_profiles`). Defaults to False.
+
+    Returns:
+        dict: "households" (pd.Index), "sums" and "counts" (np.ndarray, as in
+            `HouseholdProfileAccumulator`), "profiles" (dict of pd.DataFrame)
+            and "report" (data quality report, pd.DataFrame).
+    """
+    readings, report = process_raw_blocks(file_paths, progress=False)
+    data = readings.rename_axis("tstp").reset_index()
+    data["time"] = data["tstp"].dt.time
+
+    accumulator = HouseholdProfileAccumulator(capacity=max(readings.shape[1], 1))
+    # Add in chunks of timestamps to bound the size of the flattened readings
+    for start in range(0, len(data), meter_data_chunksize):
+        accumulator.add_meter_data(data.iloc[start : start + meter_data_chunksize])
+    n_households = len(accumulator.households)
+
+    return {
+        "households": accumulator.household_ids,
+        "sums": accumulator.sums[:n_households],
+        "counts": accumulator.counts[:n_households],
+        "profiles": get_usage_profiles(data) if profiles else {},
+        "report": report,
+    }
+
+
+def combine_shards(results):
+    """Combine partial aggregates from `process_shard` into aggregates for all
+    households.
+
+    Args:
+        results (list): Outputs of `process_shard`.
+
+    Returns:
+        dict: "households" (pd.Index), "sums" and "counts" (np.ndarray, as in
+            `HouseholdProfileAccumulator`) and "profiles" (dict of pd.DataFrame,
+            each holding the profiles from every shard).
+    """
+    accumulator = HouseholdProfileAccumulator(
+        capacity=max(sum(len(result["households"]) for result in results), 1)
+    )
+    for result in results:
+        accumulator.add_sums(result["households"], result["sums"], result["counts"])
+    n_households = len(accumulator.households)
+
+    profile_names = set().union(*(result["profiles"] for result in results))
+
+    return {
+        "households": accumulator.household_ids,
+        "sums": accumulator.sums[:n_households],
+        "counts": accumulator.counts[:n_households],
+        "profiles": {
+            name: pd.concat([result["profiles"][name] for result in results])
+            for name in profile_names
+        },
+    }
+
+
+def combined_variant_df(combined, variant):
+    """Produce the dataframe to cluster for a variant from combined aggregates.
+
+    Args:
+        combined (dict): Output of `combine_shards`.
+        variant (str): Name of variant.
+
+    Returns:
+        pd.DataFrame: Dataframe to cluster.
+    """
+    spec = variant_specs[variant]
+    if "profile" in spec:
+        if spec["profile"] not in combined["profiles"]:
+            raise ValueError(variant + " needs usage profiles to be computed.")
+        df = combined["profiles"][spec["profile"]]
+        if df.index.duplicated().any():
+            raise ValueError(
+                variant + " needs each household's readings to be in one shard."
+            )
+    else:
+        accumulator = HouseholdProfileAccumulator(
+            capacity=max(len(combined["households"]), 1)
+        )
+        accumulator.add_sums(
+            combined["households"], combined["sums"], combined["counts"]
+        )
+        df = pd.DataFrame(
+            accumulator.features(
+                variant_recipe(spec), np.arange(len(combined["households"]))
+            ),
+            index=accumulator.household_ids,
+            columns=pd.Index(half_hours, name="time"),
+        ).dropna(axis=0)
+
+    return df.sort_index()
+
+
+def reduce_shards(results, variants):
+    """Combine partial aggregates from `process_shard` into the dataframe to cluster
+    for each variant.
+
+    Args:
+        results (list): Outputs of `process_shard`.
+        variants (list): Names of variants.
+
+    Returns:
+        dict: Dataframes keyed by variant name.
+    """
+    combined = combine_shards(results)
+
+    return {variant: combined_variant_df(combined, variant) for variant in variants}
+
+
+def get_shard_aggregates(
+    n_shards=shard_count,
+    backend=shard_backend,
+    max_workers=shard_max_workers,
+    profiles=True,
+):
+    """Process the raw data shard by shard into aggregates for all households,
+    along with the data quality report.
+
+    Args:
+        n_shards (int, optional): Number of shards. Defaults to `shard_count`
+            in base config.
+        backend (str, optional): Shard backend (see `utils/shard_utils.py`).
+            Defaults to `shard_backend` in base config.
+        max_workers (int, optional): Maximum number of shards to process at once.
+            Defaults to `shard_max_workers` in base config.
+        profiles (bool, optional): Whether to also compute usage profiles.
+            Defaults to True.
+
+    Returns:
+        tuple: Combined aggregates (dict, see `combine_shards`) and QA report
+            (pd.DataFrame).
+    """
+    shards = partition_files(raw_data_file_paths(), n_shards)
+    print(f"Processing {len(shards)} shards...")
+    results = get_backend(backend, max_workers).map(
+        process_shard, [(shard, profiles) for shard in shards]
+    )
+
+    report = pd.concat([result["report"] for result in results]).sort_index()
+
+    return combine_shards(results), report
+
+
+def get_sharded_variant_dfs(
+    variants=None,
+    n_shards=shard_count,
+    backend=shard_backend,
+    max_workers=shard_max_workers,
+):
+    """Process the raw data shard by shard and produce the dataframe to cluster for
+    each variant, along with the data quality report.
+
+    Args:
+        variants (list, optional): Names of variants. Defaults to all variants.
+        n_shards (int, optional): Number of shards. Defaults to `shard_count`
+            in base config.
+        backend (str, optional): Shard backend (see `utils/shard_utils.py`).
+            Defaults to `shard_backend` in base config.
+        max_workers (int, optional): Maximum number of shards to process at once.
+            Defaults to `shard_max_workers` in base config.
+
+    Returns:
+        tuple: Dataframes keyed by variant name (dict) and QA report (pd.DataFrame).
+    """
+    if variants is None:
+        variants = list(variant_specs.keys())
+    profiles = any("profile" in variant_specs[variant] for variant in variants)
+
+    combined, report = get_shard_aggregates(n_shards, backend, max_workers, profiles)
+    variant_dfs = {
+        variant: combined_variant_df(combined, variant) for variant in variants
+    }
+
+    return variant_dfs, report
@@ -0,0 +1,374 @@
+# File: asf_smart_meter_exploration/pipeline/stages.py
+"""
+Stages of the batch pipeline (ingest, aggregate, inertia, cluster, plot) and the
+dependency graph between them. Each stage reads and writes files so that stages
+whose outputs are up to date can be skipped (see `utils/dag_utils.py`).
+
+Aggregation runs as one task per variant, so that a variant's dataframe is only
+rebuilt when its own aggregation changes. Usage profiles for the quantile and peak
+day variants are computed together in an upstream "profiles" task.
+"""
+
+import json
+import os
+
+import pandas as pd
+
+from asf_smart_meter_exploration import PROJECT_DIR, base_config
+from asf_smart_meter_exploration.config.plot_variants import (
+    aggregation_params,
+    variant_params,
+    variant_specs,
+)
+from asf_smart_meter_exploration.utils.dag_utils import Task
+
+meter_data_folder_path = PROJECT_DIR / base_config["meter_data_folder_path"]
+meter_data_merged_file_path = PROJECT_DIR / base_config["meter_data_merged_file_path"]
+quality_report_file_path = PROJECT_DIR / base_config["quality_report_file_path"]
+usage_profiles_file_path = PROJECT_DIR / base_config["usage_profiles_file_path"]
+shard_aggregates_file_path = PROJECT_DIR / base_config["shard_aggregates_file_path"]
+household_data_file_path = PROJECT_DIR / base_config["household_data_file_path"]
+variant_data_folder_path = PROJECT_DIR / base_config["variant_data_folder_path"]
+cluster_labels_folder_path = PROJECT_DIR / base_config["cluster_labels_folder_path"]
+inertia_plot_folder_path = PROJECT_DIR / base_config["inertia_plot_folder_path"]
+cluster_plot_folder_path = PROJECT_DIR / base_config["cluster_plot_folder_path"]
+plot_suffix = base_config["plot_suffix"]
+
+stage_names = ["ingest", "aggregate", "inertia", "cluster", "plot"]
+plot_parameter_keys = ["normalised", "ylabel", "ymin", "ymax"]
+quality_parameter_keys = [
+    "gap_fill_method",
+    "gap_fill_max_gap",
+    "outlier_threshold_mads",
+    "outlier_max_kwh",
+]
+
+
+def variant_file(variant):
+    """Path of the saved dataframe for a variant."""
+    return variant_data_folder_path / (variant + ".pkl")
+
+
+def labels_file(variant):
+    """Path of the saved cluster assignments for a variant."""
+    return cluster_labels_folder_path / (variant + ".csv")
+
+
+def centroids_file(variant):
+    """Path of the saved cluster centroids for a variant."""
+    return cluster_labels_folder_path / (variant + "_centroids.csv")
+
+
+def recipe_file(variant):
+    """Path of the saved feature recipe for a variant."""
+    return cluster_labels_folder_path / (variant + "_recipe.json")
+
+
+def ingest():
+    """Process the raw data into a single CSV file of half-hourly readings
+    and a data quality report."""
+    from asf_smart_meter_exploration.pipeline.process_raw_data import (
+        produce_all_properties_df,
+    )
+
+    produce_all_properties_df()
+
+
+def profiles():
+    """Compute and save the usage profiles (see `get_usage_profiles`) of every
+    household from the merged meter data."""
+    from asf_smart_meter_exploration.getters.get_processed_data import (
+        get_meter_data_chunks,
+    )
+    from asf_smart_meter_exploration.pipeline.data_aggregation import (
+        get_usage_profiles,
+    )
+
+    pd.to_pickle(get_usage_profiles(get_meter_data_chunks()), usage_profiles_file_path)
+
+
+def aggregate(variant):
+    """Produce and save the dataframe to cluster for a variant.
+
+    Args:
+        variant (str): Name of variant.
+    """
+    from asf_smart_meter_exploration.getters.get_processed_data import get_meter_data
+
+    if not os.path.isdir(variant_data_folder_path):
+        os.makedirs(variant_data_folder_path)
+
+    spec = variant_specs[variant]
+    if "profile" in spec:
+        df = pd.read_pickle(usage_profiles_file_path)[spec["profile"]]
+    else:
+        df = spec["aggregation"](get_meter_data(), **spec["aggregation_kwargs"])
+    df.to_pickle(variant_file(variant))
+
+
+def sharded_ingest(n_shards, backend):
+    """Process the raw data shard by shard (see `pipeline/sharding.py`) and save the
+    combined per-household aggregates and the data quality report.
+
+    Args:
+        n_shards (int): Number of shards.
+        backend (str): Shard backend (see `utils/shard_utils.py`).
+    """
+    from asf_smart_meter_exploration.pipeline.sharding import get_shard_aggregates
+
+    combined, report = get_shard_aggregates(n_shards, backend)
+    pd.to_pickle(combined, shard_aggregates_file_path)
+    report.to_csv(quality_report_file_path)
+
+
+def sharded_aggregate(variant):
+    """Produce and save the dataframe to cluster for a variant from the aggregates
+    saved by `sharded_ingest`.
+
+    Args:
+        variant (str): Name of variant.
+    """
+    from asf_smart_meter_exploration.pipeline.sharding import combined_variant_df
+
+    if not os.path.isdir(variant_data_folder_path):
+        os.makedirs(variant_data_folder_path)
+
+    combined = pd.read_pickle(shard_aggregates_file_path)
+    combined_variant_df(combined, variant).to_pickle(variant_file(variant))
+
+
+def inertia(variant):
+    """Produce and save the inertia plot for a variant.
+
+    Args:
+        variant (str): Name of variant.
+    """
+    from asf_smart_meter_exploration.getters.get_processed_data import (
+        get_variant_data,
+    )
+    from asf_smart_meter_exploration.utils.clustering_utils import clustering_inertias
+    from asf_smart_meter_exploration.utils.plotting_utils import plot_inertias
+
+    if not os.path.isdir(inertia_plot_folder_path):
+        os.makedirs(inertia_plot_folder_path)
+
+    plot_inertias(clustering_inertias(get_variant_data(variant)), filename=variant)
+
+
+def cluster(variant, run_id=None):
+    """Cluster a variant and save the cluster assignments, the centroids and the
+    recipe for building the variant's features (used by
+    `pipeline/cluster_service.py`). The results are also recorded in the results
+    store (see `pipeline/results_store.py`).
+
+    Args:
+        variant (str): Name of variant.
+        run_id (str, optional): Run to record the results under.
+            Defaults to a new run.
+    """
+    from asf_smart_meter_exploration.getters.get_processed_data import (
+        get_variant_data,
+    )
+    from asf_smart_meter_exploration.pipeline.incremental_features import (
+        variant_recipe,
+    )
+    from asf_smart_meter_exploration.pipeline.results_store import (
+        ResultsStore,
+        new_run_id,
+    )
+    from asf_smart_meter_exploration.utils.clustering_utils import fit_clustering
+
+    if not os.path.isdir(cluster_labels_folder_path):
+        os.makedirs(cluster_labels_folder_path)
+
+    df = get_variant_data(variant)
+    kmeans = fit_clustering(df, variant_specs[variant]["k"])
+    recipe = variant_recipe(variant_specs[variant])
+
+    clusters = ResultsStore().record_clustering(
+        run_id or new_run_id(),
+        variant,
+        df,
+        kmeans.cluster_centers_,
+        recipe,
+        inertia=kmeans.inertia_,
+    )
+
+    df.assign(cluster=clusters)[["cluster"]].to_csv(
+        labels_file(variant), index_label="LCLid"
+    )
+    pd.DataFrame(kmeans.cluster_centers_, columns=df.columns).to_csv(
+        centroids_file(variant), index_label="cluster"
+    )
+    with open(recipe_file(variant), "w") as f:
+        json.dump(recipe, f, indent=2)
+
+
+def plot(variant):
+    """Produce and save the cluster plots for a variant.
+
+    Args:
+        variant (str): Name of variant.
+    """
+    from asf_smart_meter_exploration.analysis.clustering import plot_variant_clusters
+    from asf_smart_meter_exploration.getters.get_processed_data import (
+        get_variant_clusters,
+        get_variant_data,
+    )
+
+    df = get_variant_data(variant)
+    clusters = get_variant_clusters(variant).reindex(df.index).to_numpy()
+
+    plot_variant_clusters(variant, df, clusters)
+
+
+def build_tasks(variants=None, shards=None, backend=None, run_id=None):
+    """Build the task graph for the given variants.
+
+    Args:
+        variants (list, optional): Names of variants. Defaults to all variants.
+        shards (int, optional): If given, ingest is split across this many shards
+            of households and saves per-household aggregates instead of the merged
+            meter data. Defaults to None.
+        backend (str, optional): Shard backend (see `utils/shard_utils.py`).
+            Defaults to `shard_backend` in base config.
+        run_id (str, optional): Run that cluster stages record their results under
+            in the results store. Defaults to a new run for each cluster stage.
+
+    Returns:
+        dict: Tasks keyed by name. Tasks for stage X on variant Y are named "X:Y".
+            The "profiles" task is run as a dependency of the aggregate stage.
+    """
+    if variants is None:
+        variants = list(variant_specs.keys())
+
+    unknown = [variant for variant in variants if variant not in variant_specs]
+    if unknown:
+        raise ValueError(", ".join(unknown) + " not implemented.")
+
+    quality_params = str([base_config[key] for key in quality_parameter_keys])
+
+    if shards:
+        tasks = [
+            Task(
+                "ingest",
+                sharded_ingest,
+                args=(shards, backend or base_config["shard_backend"]),
+                inputs=[meter_data_folder_path],
+                outputs=[shard_aggregates_file_path, quality_report_file_path],
+                params=quality_params + "; sharded",
+            )
+        ]
+    else:
+        tasks = [
+            Task(
+                "ingest",
+                ingest,
+                inputs=[meter_data_folder_path],
+                outputs=[meter_data_merged_file_path, quality_report_file_path],
+                params=quality_params,
+            )
+        ]
+        if any("profile" in variant_specs[variant] for variant in variants):
+            tasks.append(
+                Task(
+                    "profiles",
+                    profiles,
+                    inputs=[meter_data_merged_file_path],
+                    outputs=[usage_profiles_file_path],
+                    deps=["ingest"],
+                )
+            )
+
+    for variant in variants:
+        if shards:
+            aggregate_task = Task(
+                "aggregate:" + variant,
+                sharded_aggregate,
+                args=(variant,),
+                inputs=[shard_aggregates_file_path],
+                outputs=[variant_file(variant)],
+                params=aggregation_params(variant),
+                deps=["ingest"],
+            )
+        elif "profile" in variant_specs[variant]:
+            aggregate_task = Task(
+                "aggregate:" + variant,
+                aggregate,
+                args=(variant,),
+                inputs=[usage_profiles_file_path],
+                outputs=[variant_file(variant)],
+                params=aggregation_params(variant),
+                deps=["profiles"],
+            )
+        else:
+            aggregate_task = Task(
+                "aggregate:" + variant,
+                aggregate,
+                args=(variant,),
+                inputs=[meter_data_merged_file_path],
+                outputs=[variant_file(variant)],
+                params=aggregation_params(variant),
+                deps=["ingest"],
+            )
+        tasks.append(aggregate_task)
+
+    for variant in variants:
+        tasks += [
+            Task(
+                "inertia:" + variant,
+                inertia,
+                args=(variant,),
+                inputs=[variant_file(variant)],
+                outputs=[
+                    inertia_plot_folder_path / (variant + "_inertia" + plot_suffix)
+                ],
+                deps=["aggregate:" + variant],
+            ),
+            Task(
+                "cluster:" + variant,
+                cluster,
+                args=(variant, run_id),
+                inputs=[variant_file(variant)],
+                outputs=[
+                    labels_file(variant),
+                    centroids_file(variant),
+                    recipe_file(variant),
+                ],
+                params=variant_params(variant),
+                deps=["aggregate:" + variant],
+            ),
+            Task(
+                "plot:" + variant,
+                plot,
+                args=(variant,),
+                inputs=[
+                    variant_file(variant),
+                    labels_file(variant),
+                    household_data_file_path,
+                ],
+                outputs=[
+                    cluster_plot_folder_path / (variant + suffix + plot_suffix)
+                    for suffix in ["_observations", "_counts", "_tariff", "_acorn"]
+                ],
+                params=str(
+                    [variant_specs[variant][key] for key in plot_parameter_keys]
+                ),
+                deps=["cluster:" + variant],
+            ),
+        ]
+
+    return {task.name: task for task in tasks}
+
+
+def stage_tasks(tasks, stage):
+    """Names of the tasks belonging to a stage.
+
+    Args:
+        tasks (dict): Tasks keyed by name.
+        stage (str): One of `stage_names`.
+
+    Returns:
+        list: Task names.
+    """
+    return [name for name in tasks if name.split(":")[0] == stage]
@@ -3,7 +3,8 @@
 Reusable functions for clustering.
 """
 
-from sklearn.cluster import KMeans
+import numpy as np
+import pandas as pd
 
 from asf_smart_meter_exploration import base_config
 
@@ -20,6 +21,8 @@ def clustering_inertias(data, n=10):
         n (int, optional): Max k to try. Defaults to 10.
     """
 
+    from sklearn.cluster import KMeans
+
     inertias = []
 
     for i in range(1, n + 1):
@@ -30,6 +33,25 @@ def clustering_inertias(data, n=10):
     return inertias
 
 
+def fit_clustering(data, k=3):
+    """Fit k-means clustering with specified value of k.
+
+    Args:
+        data (pd.DataFrame): Dataframe structured with households as rows and
+            columns for each half hour.
+        k (int, optional): Number of clusters. Defaults to 3.
+
+    Returns:
+        KMeans: Fitted model.
+    """
+    from sklearn.cluster import KMeans
+
+    kmeans = KMeans(n_clusters=k, random_state=random_state, n_init=10)
+    kmeans.fit(data)
+
+    return kmeans
+
+
 def run_clustering(data, k=3):
     """Perform k-means clustering with specified value of k.
 
@@ -42,9 +64,64 @@ def run_clustering(data, k=3):
         list: Cluster assignments for each row of `data`.
     """
 
-    kmeans = KMeans(n_clusters=k, random_state=random_state, n_init=10)
-    kmeans.fit(data)
+    kmeans = fit_clustering(data, k)
 
     clusters = kmeans.predict(data)
 
     return clusters
+
+
+def nearest_centroids(features, centroids):
+    """Find the nearest centroid to each row of features, for many rows at once.
+
+    Args:
+        features (np.ndarray): Array with a row per household.
+        centroids (np.ndarray): Array with a row per cluster.
+
+    Returns:
+        tuple: Cluster of each row (np.ndarray) and Euclidean distance to it
+            (np.ndarray).
+    """
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, computed for all pairs with one matrix product
+    squared_distances = (
+        (features**2).sum(axis=1)[:, None]
+        - 2 * features @ centroids.T
+        + (centroids**2).sum(axis=1)[None, :]
+    )
+    clusters = squared_distances.argmin(axis=1)
+    distances = np.sqrt(
+        np.maximum(squared_distances[np.arange(len(features)), clusters], 0)
+    )
+
+    return clusters, distances
+
+
+def cluster_category_counts(clusters, categories):
+    """Count the households in each cluster for each category (e.g. tariff type).
+    Equivalent to `pd.crosstab(clusters, categories)` but counts integer codes directly.
+
+    Args:
+        clusters (array-like): Cluster designations.
+        categories (pd.Series): Category of each household, ideally with a
+            categorical dtype. Missing categories are not counted.
+
+    Returns:
+        pd.DataFrame: Counts with a row for each cluster and a column for each category.
+    """
+    clusters = np.asarray(clusters, dtype=np.int64)
+    categories = pd.Categorical(categories)
+
+    n_clusters = clusters.max() + 1
+    n_categories = len(categories.categories)
+    known = categories.codes >= 0
+
+    counts = np.bincount(
+        clusters[known] * n_categories + categories.codes[known],
+        minlength=n_clusters * n_categories,
+    ).reshape(n_clusters, n_categories)
+
+    return pd.DataFrame(
+        counts,
+        index=pd.Index(range(n_clusters), name="cluster"),
+        columns=categories.categories,
+    )
@@ -0,0 +1,208 @@
+# File: asf_smart_meter_exploration/utils/dag_utils.py
+"""
+Reusable functions for running a dependency graph of tasks that read and write files.
+A task is skipped if its outputs are newer than its inputs and neither its inputs
+nor its parameters have changed since it last ran. Independent tasks run concurrently.
+"""
+
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+
+class Task:
+    """A unit of work in the graph.
+
+    Args:
+        name (str): Unique task name, e.g. "cluster:total_usage".
+        func (callable): Top-level function to run (must be picklable).
+        args (tuple, optional): Positional arguments for `func`. Defaults to ().
+        inputs (list, optional): Files or folders the task reads. Defaults to [].
+        outputs (list, optional): Files the task writes. Defaults to [].
+        params (str, optional): Description of any settings that should trigger
+            a rerun when changed (e.g. the value of k). Defaults to "".
+        deps (list, optional): Names of tasks that must finish first. Defaults to [].
+    """
+
+    def __init__(self, name, func, args=(), inputs=(), outputs=(), params="", deps=()):
+        self.name = name
+        self.func = func
+        self.args = tuple(args)
+        self.inputs = [str(path) for path in inputs]
+        self.outputs = [str(path) for path in outputs]
+        self.params = params
+        self.deps = list(deps)
+
+
+def fingerprint(path):
+    """Size and modification time of a file, or of every file in a folder.
+
+    Args:
+        path (str): File or folder path.
+
+    Returns:
+        list or None: Fingerprint, or None if the path does not exist.
+    """
+    if os.path.isdir(path):
+        return sorted(
+            [entry.name, entry.stat().st_size, entry.stat().st_mtime_ns]
+            for entry in os.scandir(path)
+            if entry.is_file()
+        )
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [stat.st_size, stat.st_mtime_ns]
+    return None
+
+
+def _latest_mtime(path):
+    """Most recent modification time of a file or of any file in a folder."""
+    if os.path.isdir(path):
+        return max(
+            (entry.stat().st_mtime_ns for entry in os.scandir(path) if entry.is_file()),
+            default=0,
+        )
+    return os.stat(path).st_mtime_ns
+
+
+def task_state(task):
+    """Record of a task's inputs and parameters, compared between runs.
+
+    Args:
+        task (Task): Task to describe.
+
+    Returns:
+        dict: Input fingerprints and parameters.
+    """
+    return {
+        "inputs": {path: fingerprint(path) for path in task.inputs},
+        "params": task.params,
+    }
+
+
+def is_fresh(task, recorded_state):
+    """Whether a task's outputs are up to date.
+
+    Args:
+        task (Task): Task to check.
+        recorded_state (dict or None): State recorded when the task last ran.
+
+    Returns:
+        bool: True if the task can be skipped.
+    """
+    if not all(os.path.isfile(path) for path in task.outputs):
+        return False
+    if recorded_state is None:
+        return False
+
+    current_state = task_state(task)
+    if recorded_state["params"] != current_state["params"]:
+        return False
+
+    # Raw inputs may have been removed after processing, so a missing input is
+    # fine as long as it was there when the task last ran. Inputs that still
+    # exist must be unchanged.
+    existing_inputs = [path for path in task.inputs if os.path.exists(path)]
+    recorded_inputs = recorded_state["inputs"]
+    for path in task.inputs:
+        recorded = recorded_inputs.get(path)
+        if recorded is None or (
+            path in existing_inputs and recorded != current_state["inputs"][path]
+        ):
+            return False
+
+    oldest_output = min(os.stat(path).st_mtime_ns for path in task.outputs)
+    newest_input = max((_latest_mtime(path) for path in existing_inputs), default=0)
+
+    return oldest_output >= newest_input
+
+
+def with_dependencies(tasks, names):
+    """Select the named tasks and every task they depend on.
+
+    Args:
+        tasks (dict): All tasks keyed by name.
+        names (list): Names of the tasks to run.
+
+    Returns:
+        dict: Selected tasks keyed by name.
+    """
+    selected = {}
+    to_visit = list(names)
+    while to_visit:
+        name = to_visit.pop()
+        if name not in selected:
+            selected[name] = tasks[name]
+            to_visit.extend(tasks[name].deps)
+
+    return selected
+
+
+def run_tasks(tasks, state_file_path, max_workers=4, force=False):
+    """Run tasks in dependency order, skipping those whose outputs are fresh
+    and running independent tasks in parallel processes.
+
+    Args:
+        tasks (dict): Tasks to run keyed by name. Dependencies outside `tasks`
+            are ignored.
+        state_file_path (str or Path): JSON file where task states are recorded.
+        max_workers (int, optional): Maximum number of concurrent tasks. Defaults to 4.
+        force (bool, optional): Whether to run every task regardless of freshness.
+            Defaults to False.
+
+    Returns:
+        dict: Names of tasks that were "run" and "skipped".
+    """
+    state = {}
+    if os.path.isfile(state_file_path):
+        with open(state_file_path) as f:
+            state = json.load(f)
+
+    deps = {name: [d for d in task.deps if d in tasks] for name, task in tasks.items()}
+    done, running = set(), {}
+    summary = {"run": [], "skipped": []}
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        while len(done) < len(tasks):
+            ready = [
+                name
+                for name in tasks
+                if name not in done
+                and name not in running.values()
+                and all(d in done for d in deps[name])
+            ]
+            for name in ready:
+                task = tasks[name]
+                if not force and is_fresh(task, state.get(name)):
+                    print(f"Skipping {name} (up to date).")
+                    summary["skipped"].append(name)
+                    done.add(name)
+                else:
+                    print(f"Running {name}...")
+                    running[executor.submit(task.func, *task.args)] = name
+
+            if ready and any(name in done for name in ready):
+                # Skipped tasks may have unblocked others without anything finishing
+                continue
+            if not running:
+                raise ValueError("Task dependencies contain a cycle.")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            errors = []
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    errors.append(future.exception())
+                    continue
+                state[name] = task_state(tasks[name])
+                summary["run"].append(name)
+                done.add(name)
+
+            os.makedirs(os.path.dirname(state_file_path), exist_ok=True)
+            with open(state_file_path, "w") as f:
+                json.dump(state, f, indent=2)
+
+            if errors:
+                raise errors[0]
+
+    return summary
@@ -0,0 +1,95 @@
+# File: asf_smart_meter_exploration/utils/import_checks.py
+"""
+Script to check that importing the package stays fast. Each module listed in
+base config is imported in a fresh interpreter with `python -X importtime`;
+the check fails if its cumulative import time exceeds its budget or if it
+pulls in any of the heavy libraries that should only be imported when used.
+Run with `make check-import-time`.
+"""
+
+import subprocess
+import sys
+
+from asf_smart_meter_exploration import base_config
+
+import_time_budgets_ms = base_config["import_time_budgets_ms"]
+lazy_modules = base_config["lazy_modules"]
+
+
+def measure_import(module):
+    """Import a module in a fresh interpreter and measure the import.
+
+    Args:
+        module (str): Dotted module name.
+
+    Returns:
+        tuple: Cumulative import time of `module` in milliseconds, and the set of
+            top-level packages that were imported.
+
+    Raises:
+        ValueError: if `module`'s import time is missing from the `-X importtime`
+            output.
+    """
+    command = [
+        sys.executable,
+        "-X",
+        "importtime",
+        "-c",
+        f"import sys, {module}; print(' '.join(sys.modules))",
+    ]
+    # Run once first so that bytecode compilation is not counted
+    subprocess.run(command, capture_output=True, check=True)
+    result = subprocess.run(command, capture_output=True, text=True, check=True)
+
+    import_time_us = None
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            import_time_us = int(cumulative)
+
+    if import_time_us is None:
+        raise ValueError(f"No import time reported for {module}.")
+
+    loaded = {name.split(".")[0] for name in result.stdout.split()}
+
+    return import_time_us / 1000, loaded
+
+
+def check_imports(budgets_ms=import_time_budgets_ms):
+    """Check import times and lazily imported libraries for each module.
+
+    Args:
+        budgets_ms (dict, optional): Import time budget in milliseconds for each module.
+            Defaults to `import_time_budgets_ms` in base config.
+
+    Returns:
+        list: Descriptions of any failures.
+    """
+    failures = []
+    for module, budget_ms in budgets_ms.items():
+        try:
+            import_time_ms, loaded = measure_import(module)
+        except ValueError as error:
+            failures.append(str(error))
+            continue
+        print(f"{module}: {import_time_ms:.0f} ms (budget {budget_ms} ms)")
+
+        if import_time_ms > budget_ms:
+            failures.append(
+                f"{module} took {import_time_ms:.0f} ms to import "
+                f"(budget {budget_ms} ms)."
+            )
+        eager = sorted(loaded.intersection(lazy_modules))
+        if eager:
+            failures.append(f"{module} imports {', '.join(eager)} at import time.")
+
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check_imports()
+    for failure in failures:
+        print(failure)
+    sys.exit(1 if failures else 0)
@@ -1,16 +1,16 @@
 # File: asf_smart_meter_exploration/utils/plotting_utils.py
 """
 Reusable functions for plotting.
+Plotting libraries are imported inside the functions that use them so that
+importing this module (and the analysis scripts that use it) stays fast.
 """
 
-import pandas as pd
-import altair as alt
-import matplotlib.pyplot as plt
-import matplotlib.patheffects as pe
-import matplotlib.ticker as mtick
 import datetime
 
+import pandas as pd
+
 from asf_smart_meter_exploration import base_config, PROJECT_DIR
+from asf_smart_meter_exploration.utils.clustering_utils import cluster_category_counts
 
 cluster_plot_folder_path = PROJECT_DIR / base_config["cluster_plot_folder_path"]
 inertia_plot_folder_path = PROJECT_DIR / base_config["inertia_plot_folder_path"]
@@ -70,6 +70,10 @@ def plot_observations_and_clusters(
         ymin (int, optional): Minimum value on y axis. Defaults to 0.
         ymax (float, optional): Maximum value on y axis. Defaults to 0.2.
     """
+    import matplotlib.patheffects as pe
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as mtick
+
     # Using matplotlib here due to issues with how Altair deals with times
     # Line below makes times work
     pd.plotting.register_matplotlib_converters()
@@ -112,6 +116,53 @@ def plot_observations_and_clusters(
     plt.clf()
 
 
+def plot_daily_archetypes(
+    archetypes,
+    filename_infix,
+    normalised=True,
+    ylabel="Electricity usage (normalised)",
+):
+    """Produce and save plot of archetype daily load shapes.
+
+    Args:
+        archetypes (pd.DataFrame): Archetypes as rows, with a column for each half hour.
+        filename_infix (str): Description of archetypes (e.g. "daily_archetypes").
+            Appears in filename.
+        normalised (bool, optional): Whether the archetypes have been normalised
+            (determines whether or not to display y axis as a percentage).
+            Defaults to True.
+        ylabel (str, optional): y axis label.
+            Defaults to "Electricity usage (normalised)".
+    """
+    import matplotlib.pyplot as plt
+    import matplotlib.ticker as mtick
+
+    pd.plotting.register_matplotlib_converters()
+
+    fig, ax = plt.subplots()
+
+    fig.set_size_inches(12, 6)
+
+    for i, (archetype, profile) in enumerate(archetypes.iterrows()):
+        ax.plot(profile, lw=3, color=f"C{i}", label=archetype)
+
+    ax.legend(title="Archetype", loc="upper right")
+    ax.set_xlabel("Time")
+    ax.set_ylabel(ylabel)
+    ax.set_xlim(datetime.time(0, 0, 0), datetime.time(23, 30, 00))
+    ax.set_ylim(0)
+    if normalised:
+        ax.yaxis.set_major_formatter(mtick.PercentFormatter(1, decimals=0))
+
+    ax.set_xticks(["00:00:00", "06:00:00", "12:00:00", "18:00:00"])
+
+    plt.savefig(
+        cluster_plot_folder_path / (filename_infix + "_archetypes" + plot_suffix),
+        dpi=100,
+    )
+    plt.clf()
+
+
 def plot_cluster_counts(clusters, filename_infix):
     """Produce bar chart of numbers of households in each cluster.
 
@@ -120,6 +171,8 @@ def plot_cluster_counts(clusters, filename_infix):
         filename_infix (str): Description of variant (e.g. "normalised_usage").
             Appears in filename.
     """
+    import altair as alt
+
     clusters = pd.DataFrame(clusters, columns=["cluster"])
     counts = clusters.value_counts().reset_index(name="count")
 
@@ -149,9 +202,10 @@ def plot_tariff_cluster_distribution(merged_data, filename_infix):
         filename_infix (str): Description of variant (e.g. "normalised_usage").
             Appears in filename.
     """
+    import altair as alt
 
     cluster_tariff_counts = (
-        pd.crosstab(merged_data.cluster, merged_data.stdorToU)
+        cluster_category_counts(merged_data.cluster, merged_data.stdorToU)
         .reset_index()
         .melt("cluster", var_name="tariff_type", value_name="number")
     )
@@ -200,7 +254,11 @@ def plot_acorn_cluster_distribution(merged_data, filename_infix):
         filename_infix (str): Description of variant (e.g. "normalised_usage").
             Appears in filename.
     """
-    cluster_acorn_counts = pd.crosstab(merged_data.cluster, merged_data.Acorn_grouped)
+    import altair as alt
+
+    cluster_acorn_counts = cluster_category_counts(
+        merged_data.cluster, merged_data.Acorn_grouped
+    )
     cluster_acorn_counts["Other"] = (
         cluster_acorn_counts["ACORN-"] + cluster_acorn_counts["ACORN-U"]
     )
@@ -248,6 +306,8 @@ def plot_inertias(inertias, filename):
         inertias (list): List of inertias.
         filename (str): Filename to save plot to.
     """
+    import matplotlib.pyplot as plt
+
     plt.plot(range(1, len(inertias) + 1), inertias)
     plt.xlabel("Number of clusters")
     plt.ylabel("Within-cluster sum of squared errors")
@@ -0,0 +1,131 @@
+# File: asf_smart_meter_exploration/utils/quantile_utils.py
+"""
+Streaming quantile estimation for many series at once.
+Uses the P² algorithm (Jain & Chlamtac, 1985), vectorised so that a single
+update covers every household / half-hour pair for one day of readings.
+"""
+
+import numpy as np
+
+
+class P2QuantileSketch:
+    """Estimate one quantile for each of many streams without storing the observations.
+
+    Each stream keeps five markers (heights and positions), so memory is constant
+    in the number of observations.
+
+    Args:
+        shape (tuple): Shape of each batch of observations, e.g. (households, 48).
+        quantile (float): Quantile to estimate, between 0 and 1.
+    """
+
+    def __init__(self, shape, quantile):
+        if not 0 < quantile < 1:
+            raise ValueError("Quantile must be strictly between 0 and 1.")
+
+        self.shape = tuple(shape)
+        self.quantile = quantile
+
+        n_streams = int(np.prod(self.shape))
+        p = quantile
+        self.count = np.zeros(n_streams, dtype=np.int64)
+        self.heights = np.zeros((n_streams, 5))
+        self.positions = np.tile(np.arange(1, 6, dtype=float), (n_streams, 1))
+        self.desired = np.tile(
+            np.array([1, 1 + 2 * p, 1 + 4 * p, 3 + 2 * p, 5]), (n_streams, 1)
+        )
+        self.increments = np.array([0, p / 2, p, (1 + p) / 2, 1])
+
+    def update(self, values):
+        """Add one observation to each stream. NaN observations are skipped.
+
+        Args:
+            values (np.ndarray): Array with the sketch's shape.
+        """
+        x = np.asarray(values, dtype=float).reshape(-1)
+        valid = ~np.isnan(x)
+
+        # Fill the five initial markers before switching to P² updates
+        filling = valid & (self.count < 5)
+        if filling.any():
+            idx = np.flatnonzero(filling)
+            self.heights[idx, self.count[idx]] = x[idx]
+            self.count[idx] += 1
+            full = idx[self.count[idx] == 5]
+            self.heights[full] = np.sort(self.heights[full], axis=1)
+
+        updating = valid & ~filling & (self.count >= 5)
+        if updating.any():
+            idx = np.flatnonzero(updating)
+            self._update_markers(idx, x[idx])
+            self.count[idx] += 1
+
+    def _update_markers(self, idx, x):
+        """Apply a P² update to the streams in `idx` with new observations `x`."""
+        q = self.heights[idx]
+        n = self.positions[idx]
+        d = self.desired[idx]
+
+        # Extend the extreme markers and find the cell each observation falls in
+        q[:, 0] = np.minimum(q[:, 0], x)
+        q[:, 4] = np.maximum(q[:, 4], x)
+        cell = np.clip((x[:, None] >= q[:, 1:4]).sum(axis=1), 0, 3)
+
+        n += np.arange(5) > cell[:, None]
+        d += self.increments
+
+        for i in (1, 2, 3):
+            diff = d[:, i] - n[:, i]
+            move = ((diff >= 1) & (n[:, i + 1] - n[:, i] > 1)) | (
+                (diff <= -1) & (n[:, i - 1] - n[:, i] < -1)
+            )
+            if not move.any():
+                continue
+            s = np.sign(diff[move])
+            qm, qi, qp = q[move, i - 1], q[move, i], q[move, i + 1]
+            nm, ni, np_ = n[move, i - 1], n[move, i], n[move, i + 1]
+
+            parabolic = qi + s / (np_ - nm) * (
+                (ni - nm + s) * (qp - qi) / (np_ - ni)
+                + (np_ - ni - s) * (qi - qm) / (ni - nm)
+            )
+            neighbour = np.where(s > 0, qp, qm)
+            neighbour_pos = np.where(s > 0, np_, nm)
+            linear = qi + s * (neighbour - qi) / (neighbour_pos - ni)
+
+            q[move, i] = np.where(
+                (qm < parabolic) & (parabolic < qp), parabolic, linear
+            )
+            n[move, i] += s
+
+        self.heights[idx] = q
+        self.positions[idx] = n
+        self.desired[idx] = d
+
+    def result(self):
+        """Current quantile estimates. Streams with fewer than five observations
+        use the exact quantile of what has been seen; empty streams are NaN.
+
+        Returns:
+            np.ndarray: Estimates with the sketch's shape.
+        """
+        estimates = self.heights[:, 2].copy()
+
+        partial = self.count < 5
+        if partial.any():
+            idx = np.flatnonzero(partial)
+            seen = self.heights[idx].copy()
+            seen[np.arange(5) >= self.count[idx, None]] = np.nan
+            with np.errstate(all="ignore"):
+                estimates[idx] = _nanquantile_rows(seen, self.quantile)
+
+        return estimates.reshape(self.shape)
+
+
+def _nanquantile_rows(values, quantile):
+    """Row-wise quantile ignoring NaNs, returning NaN for all-NaN rows."""
+    out = np.full(values.shape[0], np.nan)
+    has_values = ~np.isnan(values).all(axis=1)
+    if has_values.any():
+        out[has_values] = np.nanquantile(values[has_values], quantile, axis=1)
+    return out
@@ -0,0 +1,124 @@
+# File: asf_smart_meter_exploration/utils/shard_utils.py
+"""
+Reusable functions for splitting work into shards and running a function on each
+shard through a pluggable backend.
+
+Backends are looked up by name in `shard_backends`. To run shards somewhere else
+(e.g. on the nodes of a cluster), subclass `ShardBackend`, implement `map` and pass
+the class as "module.path:ClassName" wherever a backend name is accepted.
+"""
+
+import importlib
+import os
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+
+
+class ShardBackend(ABC):
+    """Runs a function on each shard and returns the results.
+
+    Args:
+        max_workers (int, optional): Maximum number of shards to process at once.
+            Defaults to None (backend's choice).
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    @abstractmethod
+    def map(self, func, shard_args):
+        """Call `func(*args)` for each entry of `shard_args`.
+
+        Args:
+            func (callable): Top-level function (must be picklable for most
+                backends).
+            shard_args (list): Tuple of arguments for each shard.
+
+        Returns:
+            list: Results, in the order of `shard_args`.
+        """
+
+
+class SerialBackend(ShardBackend):
+    """Processes shards one after another in the current process (for debugging)."""
+
+    def map(self, func, shard_args):
+        """Call `func(*args)` for each entry of `shard_args` in turn.
+
+        Args:
+            func (callable): Function to call.
+            shard_args (list): Tuple of arguments for each shard.
+
+        Returns:
+            list: Results, in the order of `shard_args`.
+        """
+        return [func(*args) for args in shard_args]
+
+
+class LocalBackend(ShardBackend):
+    """Processes shards in parallel on worker processes of the local machine."""
+
+    def map(self, func, shard_args):
+        """Call `func(*args)` for each entry of `shard_args` on a pool of
+        `max_workers` processes.
+
+        Args:
+            func (callable): Top-level function (must be picklable).
+            shard_args (list): Tuple of arguments for each shard.
+
+        Returns:
+            list: Results, in the order of `shard_args`.
+        """
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(func, *args) for args in shard_args]
+            return [future.result() for future in futures]
+
+
+shard_backends = {
+    "serial": SerialBackend,
+    "local": LocalBackend,
+}
+
+
+def get_backend(name, max_workers=None):
+    """Create a shard backend.
+
+    Args:
+        name (str): Key of `shard_backends`, or "module.path:ClassName" of a
+            `ShardBackend` subclass.
+        max_workers (int, optional): Maximum number of shards to process at once.
+            Defaults to None.
+
+    Returns:
+        ShardBackend: Backend instance.
+    """
+    if name in shard_backends:
+        backend_class = shard_backends[name]
+    elif ":" in name:
+        module_name, class_name = name.split(":", 1)
+        backend_class = getattr(importlib.import_module(module_name), class_name)
+    else:
+        raise ValueError(name + " shard backend not implemented.")
+
+    return backend_class(max_workers)
+
+
+def partition_files(file_paths, n_shards):
+    """Split files into shards of similar total size, largest files first.
+
+    Args:
+        file_paths (list): Paths of files to split.
+        n_shards (int): Number of shards.
+
+    Returns:
+        list: List of file paths for each non-empty shard.
+    """
+    shards = [[] for _ in range(n_shards)]
+    shard_sizes = [0] * n_shards
+
+    for file_path in sorted(file_paths, key=os.path.getsize, reverse=True):
+        smallest = shard_sizes.index(min(shard_sizes))
+        shards[smallest].append(file_path)
+        shard_sizes[smallest] += os.path.getsize(file_path)
+
+    return [shard for shard in shards if shard]
@@ -1,4 +1,5 @@
 """asf_smart_meter_exploration."""
+
 from pathlib import Path
 from setuptools import find_packages
 from setuptools import setup
@@ -19,6 +20,9 @@ setup(
     install_requires=read_lines(BASE_DIR / "requirements.txt"),
     extras_require={"dev": read_lines(BASE_DIR / "requirements_dev.txt")},
     packages=find_packages(exclude=["docs"]),
+    entry_points={
+        "console_scripts": ["smartmeter=asf_smart_meter_exploration.cli:main"]
+    },
     version="0.1.0",
     description="Exploratory analysis of smart meter data to inform future ASF projects",
     author="Nesta",